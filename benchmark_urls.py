@@ -0,0 +1,45 @@
+"""Print the per-call cost of URL normalization and canonicalization.
+
+Run ``python benchmark_urls.py [iterations]``. No bot token is needed.
+"""
+import sys
+import time
+from typing import Any, Callable
+
+from bot import canonical_media_key, canonicalize_url, normalize_url, route_url
+
+URLS = [
+    "https://youtu.be/dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ&t=30",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ&si=abcdef",
+    "https://m.youtube.com/shorts/dQw4w9WgXcQ",
+    "https://www.tiktok.com/@user/video/7234567890123456789",
+    "https://x.com/user/status/1234567890123456789",
+    "https://open.spotify.com/track/4cOdK2wGLETKBW3PvgPWqT?si=xyz",
+    "https://soundcloud.com/artist/track-name",
+]
+
+def timed(label: str, function: Callable[[str], Any], iterations: int):
+    start = time.perf_counter()
+    for i in range(iterations):
+        function(URLS[i % len(URLS)])
+    elapsed = time.perf_counter() - start
+    print(f"{label:28} {elapsed / iterations * 1e6:8.2f} µs/call")
+
+def uncached(url: str):
+    canonicalize_url.cache_clear()
+    route_url.cache_clear()
+    return canonicalize_url(url)
+
+def main(iterations: int = 20000):
+    for url in URLS:
+        print(f"{canonical_media_key(url)!s:40} {url}")
+
+    print()
+    timed("normalize_url", normalize_url, iterations)
+    timed("route_url (cached)", route_url, iterations)
+    timed("canonicalize_url (cached)", canonicalize_url, iterations)
+    timed("canonicalize_url (uncached)", uncached, iterations)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
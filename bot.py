@@ -8,10 +8,29 @@ import asyncio
 import logging
 import zipfile
 import shutil
-from datetime import datetime
+import hashlib
+import math
+import heapq
+import uuid
+import weakref
+import functools
+import random
+import contextlib
+import sqlite3
+import multiprocessing
+import email.utils
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Union, Tuple, Callable, Awaitable
-from urllib.parse import urlparse
+from typing import Dict, List, Any, Optional, Union, Tuple, Callable, Awaitable, NamedTuple
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# yt-dlp worker processes are started with "spawn", which imports this file
+# again as __mp_main__. They only run ytdl_worker jobs, so the bot's startup
+# (logging handlers, .env, secrets) is skipped there.
+IS_WORKER_PROCESS = __name__ == "__mp_main__"
 
 # Third-party libraries
 try:
@@ -29,10 +48,17 @@ try:
 except ImportError:
     debug_write("ERROR: requests not installed")
     
+try:
+    import httpx
+except ImportError:
+    debug_write("ERROR: httpx not installed")
+
 try:
     from telegram import Bot, Update, InputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
     from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+    from telegram.ext import BaseUpdateProcessor, BaseRateLimiter
     from telegram.constants import ParseMode, ChatAction
+    from telegram.error import BadRequest, RetryAfter
 except ImportError:
     debug_write("ERROR: python-telegram-bot not installed")
     
@@ -64,8 +90,11 @@ except ImportError:
     def debug_write(message):
         print(f"DEBUG: {message}")
 
+import ytdl_worker
+
 # Add this at the start of the script
-debug_write("Bot module loaded")
+if not IS_WORKER_PROCESS:
+    debug_write("Bot module loaded")
 
 # Update the setup_logging function
 def setup_logging():
@@ -174,14 +203,18 @@ def setup_logging():
     return bot_logger, user_logger
 
 # Initialize logging
-logger, user_logger = setup_logging()
+if IS_WORKER_PROCESS:
+    logger, user_logger = logging.getLogger(__name__), logging.getLogger("user_activity")
+else:
+    logger, user_logger = setup_logging()
 
 # Load environment variables
 # First try to load from .env file
-try:
-    load_dotenv()
-except Exception as e:
-    logger.warning(f"Could not load .env file: {e}")
+if not IS_WORKER_PROCESS:
+    try:
+        load_dotenv()
+    except Exception as e:
+        logger.warning(f"Could not load .env file: {e}")
 
 # Environment variables
 class Environment:
@@ -224,6 +257,11 @@ class Environment:
             debug_write(f"Invalid API_ROOT: {self.API_ROOT}, setting to default")
             self.API_ROOT = "https://api.telegram.org"
             os.environ["TELEGRAM_API_ROOT"] = self.API_ROOT
+
+        # A self-hosted Bot API server, kept apart from API_ROOT which is cleared at startup
+        self.LOCAL_API_ROOT = self.API_ROOT.rstrip("/") if self.API_ROOT and "api.telegram.org" not in self.API_ROOT else ""
+        # Telegram's upload limit: 50 MB via api.telegram.org, 2000 MB via a local server
+        self.MAX_UPLOAD_BYTES = (2000 if self.LOCAL_API_ROOT else 50) * 1024 * 1024
         
         # Admin and whitelist settings
         admin_id = self.get_variable("ADMIN_ID", "")
@@ -251,14 +289,60 @@ class Environment:
 
         # API keys
         self.OPENAI_API_KEY = self.get_variable("OPENAI_API_KEY", "")
+        self.OPENAI_BASE_URL = self.get_variable("OPENAI_BASE_URL", "")
+        # One or more Cobalt instances, comma separated
         self.COBALT_INSTANCE_URL = self.get_variable("COBALT_INSTANCE_URL", "")
+        self.COBALT_INSTANCES = [url.strip() for url in self.COBALT_INSTANCE_URL.split(",") if url.strip()]
+        self.COBALT_HEALTH_INTERVAL = self.get_int_variable("COBALT_HEALTH_INTERVAL", 60)
         
         # Paths
         self.BASE_DIR = Path.cwd()
         self.STORAGE_DIR = self.BASE_DIR / "storage"
         self.COOKIE_FILE = self.STORAGE_DIR / "cookies.txt"
         self.TRANSLATIONS_FILE = self.STORAGE_DIR / "saved-translations.json"
+        self.TRANSLATIONS_DB = self.STORAGE_DIR / "translations.sqlite3"
         self.USER_PREFS_FILE = self.STORAGE_DIR / "user-preferences.json"
+        self.USER_PREFS_DB = self.STORAGE_DIR / "user-preferences.sqlite3"
+
+        # Media cache settings
+        self.MEDIA_CACHE_DIR = self.STORAGE_DIR / "cache"
+        self.MEDIA_CACHE_ENABLED = self.get_variable("MEDIA_CACHE_ENABLED", "true").lower() == "true"
+        self.MEDIA_CACHE_MAX_MB = self.get_int_variable("MEDIA_CACHE_MAX_MB", 2048)
+        self.MEDIA_CACHE_TTL_HOURS = self.get_int_variable("MEDIA_CACHE_TTL_HOURS", 72)
+        self.FILE_ID_INDEX_FILE = self.STORAGE_DIR / "file-ids.log"
+
+        # Download concurrency limits
+        self.DOWNLOAD_WORKERS = self.get_int_variable("DOWNLOAD_WORKERS", 4)
+        self.DOWNLOAD_WORKERS_PER_USER = self.get_int_variable("DOWNLOAD_WORKERS_PER_USER", 1)
+        # yt-dlp worker processes (0 runs yt-dlp in threads instead)
+        self.YTDL_WORKERS = self.get_int_variable("YTDL_WORKERS", 2)
+        # Extracted info kept between the preview and the download
+        self.INFO_CACHE_SIZE = self.get_int_variable("INFO_CACHE_SIZE", 64)
+        self.INFO_CACHE_TTL = self.get_int_variable("INFO_CACHE_TTL", 600)
+        # How long quality buttons stay usable
+        self.PENDING_REQUEST_TTL = self.get_int_variable("PENDING_REQUEST_TTL", 3600)
+        self.METADATA_CACHE_FILE = self.STORAGE_DIR / "metadata-cache.sqlite3"
+        # Pipe downloads straight into FFmpeg instead of transcoding afterwards
+        self.STREAM_TRANSCODE = self.get_variable("STREAM_TRANSCODE", "true").lower() == "true"
+        # Playlist and album downloads
+        self.BATCH_PARALLELISM = self.get_int_variable("BATCH_PARALLELISM", 3)
+        self.BATCH_MAX_TRACKS = self.get_int_variable("BATCH_MAX_TRACKS", 100)
+        self.BATCH_RETRIES = self.get_int_variable("BATCH_RETRIES", 2)
+        # Telegram updates handled at once; each user's updates stay in order
+        self.UPDATE_CONCURRENCY = self.get_int_variable("UPDATE_CONCURRENCY", 32)
+        # Status message edits: bot-wide rate and seconds between edits in one chat
+        self.STATUS_EDITS_PER_SECOND = self.get_int_variable("STATUS_EDITS_PER_SECOND", 20)
+        self.STATUS_EDIT_INTERVAL = self.get_int_variable("STATUS_EDIT_INTERVAL", 1)
+        self.STATUS_GROUP_EDIT_INTERVAL = self.get_int_variable("STATUS_GROUP_EDIT_INTERVAL", 3)
+        # Telegram flood limits for everything the bot sends
+        self.SEND_GLOBAL_PER_SECOND = self.get_int_variable("SEND_GLOBAL_PER_SECOND", 30)
+        self.SEND_CHAT_PER_SECOND = self.get_int_variable("SEND_CHAT_PER_SECOND", 1)
+        self.SEND_GROUP_PER_MINUTE = self.get_int_variable("SEND_GROUP_PER_MINUTE", 20)
+        self.SEND_RETRIES = self.get_int_variable("SEND_RETRIES", 3)
+        # Outbound HTTP connection pool
+        self.HTTP_MAX_CONNECTIONS = self.get_int_variable("HTTP_MAX_CONNECTIONS", 20)
+        self.HTTP_MAX_PER_HOST = self.get_int_variable("HTTP_MAX_PER_HOST", 6)
+        self.HTTP_RETRIES = self.get_int_variable("HTTP_RETRIES", 2)
 
         # Create storage directory if it doesn't exist
         self.STORAGE_DIR.mkdir(exist_ok=True)
@@ -271,18 +355,18 @@ class Environment:
         value = os.environ.get(name, default)
         return value
 
+    def get_int_variable(self, name, default: int = 0) -> int:
+        """Get an environment variable as an integer, falling back to the default."""
+        value = self.get_variable(name, "").strip()
+        return int(value) if value.isdigit() else default
+
     def get_cookie_args(self) -> List[str]:
         if self.COOKIE_FILE.exists() and self.COOKIE_FILE.is_file():
             return ["--cookies", str(self.COOKIE_FILE)]
         return []
 
 # Initialize environment
-env = Environment()
-
-# Check for required environment variables
-if not env.BOT_TOKEN:
-    logger.error("TELEGRAM_BOT_TOKEN is not set. Bot cannot start.")
-    exit(1)
+env = None if IS_WORKER_PROCESS else Environment()
 
 # Constants
 class Text:
@@ -293,7 +377,7 @@ class Text:
 
 # Callback data prefixes (simplified for audio only)
 class CallbackPrefix:
-    AUDIO_QUALITY = "aq:"  # aq:high, aq:medium, aq:low
+    AUDIO_QUALITY = "aq:"  # aq:<quality>:<pending request token>
     CANCEL = "cancel"
 
 # Audio quality options
@@ -304,36 +388,116 @@ class AudioQuality:
 
 # User preferences
 class UserPreferences:
-    def __init__(self, prefs_file: Path):
-        self.prefs_file = prefs_file
+    """Per-user settings, read from memory and persisted to SQLite.
+
+    Writes only touch the changed rows. They are collected for
+    ``flush_interval`` seconds and written in one transaction on a single
+    writer thread, so the event loop never waits on disk and concurrent
+    writers are serialized.
+    """
+
+    def __init__(self, db_file: Path, legacy_file: Optional[Path] = None, flush_interval: float = 1.0):
+        self.db_file = db_file
+        self.flush_interval = flush_interval
+        self.preferences: Dict[str, Dict] = {}
+        self.pending: Dict[Tuple[str, str], Any] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefs-writer")
+
+        self.writes = 0
+        self.flushes = 0
+
+        self.db = sqlite3.connect(str(db_file), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS preferences ("
+            "user_id TEXT, key TEXT, value TEXT, PRIMARY KEY (user_id, key))"
+        )
+        self.db.commit()
+
         self.preferences = self.load_preferences()
-    
+        if not self.preferences and legacy_file and legacy_file.exists():
+            self.import_legacy_file(legacy_file)
+
     def load_preferences(self) -> Dict:
-        """Load saved user preferences from file."""
-        if self.prefs_file.exists():
-            with open(self.prefs_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-    
+        """Load saved user preferences from the database."""
+        preferences = {}
+        for user_id, key, value in self.db.execute("SELECT user_id, key, value FROM preferences"):
+            preferences.setdefault(user_id, {})[key] = json.loads(value)
+        return preferences
+
+    def import_legacy_file(self, legacy_file: Path):
+        """Copy preferences from the old JSON file into the database."""
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.error(f"Could not read legacy preferences file {legacy_file}: {e}")
+            return
+
+        rows = [
+            (user_id, key, json.dumps(value))
+            for user_id, values in legacy.items()
+            for key, value in values.items()
+        ]
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO preferences (user_id, key, value) VALUES (?, ?, ?)", rows)
+        self.preferences = self.load_preferences()
+        logger.info(f"Imported {len(rows)} preferences from {legacy_file}")
+
+    def _write_rows(self, rows: List[Tuple[str, str, str]]):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO preferences (user_id, key, value) VALUES (?, ?, ?)", rows)
+
     async def save_preferences(self):
-        """Save user preferences to file."""
-        with open(self.prefs_file, 'w', encoding='utf-8') as f:
-            json.dump(self.preferences, f, indent=2)
-    
+        """Write all pending changes to the database."""
+        if self.flush_task and self.flush_task is not asyncio.current_task():
+            self.flush_task.cancel()
+        self.flush_task = None
+
+        if not self.pending:
+            return
+
+        rows = [(user_id, key, json.dumps(value)) for (user_id, key), value in self.pending.items()]
+        self.pending = {}
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.writer, self._write_rows, rows)
+            self.flushes += 1
+        except Exception as e:
+            logger.error(f"Failed to save user preferences: {e}")
+            # Keep the rows for the next flush unless they were changed again meanwhile
+            for user_id, key, value in rows:
+                self.pending.setdefault((user_id, key), json.loads(value))
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.save_preferences()
+
     def get_user_preference(self, user_id: int, key: str, default=None):
         """Get a specific preference for a user."""
         user_id_str = str(user_id)
         if user_id_str in self.preferences and key in self.preferences[user_id_str]:
             return self.preferences[user_id_str][key]
         return default
-    
+
     async def set_user_preference(self, user_id: int, key: str, value):
-        """Set a specific preference for a user."""
+        """Set a specific preference for a user; it is persisted on the next flush."""
         user_id_str = str(user_id)
         if user_id_str not in self.preferences:
             self.preferences[user_id_str] = {}
         self.preferences[user_id_str][key] = value
+        self.pending[(user_id_str, key)] = value
+        self.writes += 1
+
+        if not self.flush_task:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def close(self):
+        """Flush pending changes and close the database."""
         await self.save_preferences()
+        self.writer.shutdown(wait=True)
+        self.db.close()
 
 # HTML formatting helpers
 def bold(text: str) -> str:
@@ -397,72 +561,216 @@ def url_matcher(url: str, matcher: str) -> bool:
     parsed = urlparse(url)
     return parsed.netloc.endswith(matcher)
 
-def detect_platform(url: str) -> str:
-    """Detect the platform from URL."""
-    url_lower = url.lower()
-
-    # YouTube
-    if any(domain in url_lower for domain in ['youtube.com', 'youtu.be', 'music.youtube.com']):
-        return 'YouTube'
+# Platform routing
+class PlatformInfo(NamedTuple):
+    """Everything the pipeline needs to know about a platform. Treat as read-only."""
+    name: str
+    support: str  # "full", "limited" or "unsupported"
+    emoji: str
+    extractor_args: Dict
+    error_tips: str
+
+    def ydl_extractor_args(self) -> Dict:
+        """A copy of the yt-dlp extractor args that callers may modify."""
+        return {extractor: dict(args) for extractor, args in self.extractor_args.items()}
+
+PLATFORMS = {platform.name: platform for platform in [
+    PlatformInfo(
+        'YouTube', 'full', '🎥', {},
+        "💡 Tips for YouTube:\n• Check if the video is public\n• Age-restricted content may not work\n• Live streams are not supported"
+    ),
+    PlatformInfo(
+        'Instagram', 'limited', '📸', {'instagram': {'include_stories': True}},
+        "❌ Instagram requires login/cookies. This platform has limited support.\n💡 Try using YouTube or TikTok instead."
+    ),
+    PlatformInfo(
+        'Spotify', 'full', '🎵', {},
+        "💡 Tips for Spotify:\n• Make sure the track/playlist is public\n• Bot searches for tracks on YouTube\n• Some region-locked content may not be available"
+    ),
+    PlatformInfo(
+        'TikTok', 'full', '🎬', {'tiktok': {'api_hostname': 'api16-normal-c-useast1a.tiktokv.com'}},
+        "💡 Tips for TikTok:\n• Make sure the video is public\n• Private accounts may not work"
+    ),
+    PlatformInfo(
+        'Twitter/X', 'full', '🐦', {},
+        "💡 Tips for Twitter/X:\n• Make sure the tweet is public\n• Protected accounts may not work"
+    ),
+    PlatformInfo(
+        'SoundCloud', 'full', '🎧', {'soundcloud': {'client_id': None}},  # Let yt-dlp find a client_id
+        "💡 Tips for SoundCloud:\n• Make sure the track is public\n• Private tracks may not work"
+    ),
+    PlatformInfo(
+        'Facebook', 'full', '📘', {},
+        "💡 Tips for Facebook:\n• Make sure the video is public\n• Private posts may not work"
+    ),
+    PlatformInfo(
+        'Vimeo', 'full', '🎵', {},
+        "💡 Tips for Vimeo:\n• Check if the video is public\n• Password-protected videos won't work"
+    ),
+    PlatformInfo('Dailymotion', 'full', '🎵', {}, "💡 Please check if the link is valid and publicly accessible."),
+    PlatformInfo('Twitch', 'full', '🎵', {}, "💡 Please check if the link is valid and publicly accessible."),
+]}
+
+UNKNOWN_PLATFORM = PlatformInfo(
+    'Unknown Platform', 'unsupported', '🎵', {},
+    "💡 Please check if the link is valid and publicly accessible."
+)
+
+# Registered domain -> platform; subdomains match through their parent domains
+PLATFORM_HOSTS = {
+    'youtube.com': PLATFORMS['YouTube'],
+    'youtu.be': PLATFORMS['YouTube'],
+    'instagram.com': PLATFORMS['Instagram'],
+    'instagr.am': PLATFORMS['Instagram'],
+    'spotify.com': PLATFORMS['Spotify'],
+    'tiktok.com': PLATFORMS['TikTok'],
+    'twitter.com': PLATFORMS['Twitter/X'],
+    'x.com': PLATFORMS['Twitter/X'],
+    'soundcloud.com': PLATFORMS['SoundCloud'],
+    'facebook.com': PLATFORMS['Facebook'],
+    'fb.watch': PLATFORMS['Facebook'],
+    'vimeo.com': PLATFORMS['Vimeo'],
+    'dailymotion.com': PLATFORMS['Dailymotion'],
+    'twitch.tv': PLATFORMS['Twitch'],
+}
+
+@functools.lru_cache(maxsize=1024)
+def route_url(url: str) -> PlatformInfo:
+    """Return the platform of a URL by looking up its host and parent domains."""
+    if '://' not in url:
+        url = f"https://{url}"
+    try:
+        host = urlparse(url.strip()).hostname or ''
+    except ValueError:
+        return UNKNOWN_PLATFORM
 
-    # Instagram
-    elif any(domain in url_lower for domain in ['instagram.com', 'instagr.am']):
-        return 'Instagram'
+    labels = host.rstrip('.').split('.')
+    for start in range(len(labels) - 1):
+        platform = PLATFORM_HOSTS.get('.'.join(labels[start:]))
+        if platform:
+            return platform
+    return UNKNOWN_PLATFORM
 
-    # Spotify
-    elif 'spotify.com' in url_lower:
-        return 'Spotify'
+def detect_platform(url: str) -> str:
+    """Detect the platform from URL."""
+    return route_url(url).name
 
-    # TikTok
-    elif 'tiktok.com' in url_lower:
-        return 'TikTok'
+def is_supported_url(url: str) -> bool:
+    """Check if the URL is from a supported platform."""
+    return route_url(url).support == 'full'
 
-    # Twitter/X
-    elif any(domain in url_lower for domain in ['twitter.com', 'x.com']):
-        return 'Twitter/X'
+def is_limited_support_url(url: str) -> bool:
+    """Check if the URL is from a platform with limited/conditional support."""
+    return route_url(url).support == 'limited'
 
-    # SoundCloud
-    elif 'soundcloud.com' in url_lower:
-        return 'SoundCloud'
+def is_spotify_url(url: str) -> bool:
+    """Check if the URL is from Spotify."""
+    return route_url(url).name == 'Spotify'
 
-    # Facebook
-    elif any(domain in url_lower for domain in ['facebook.com', 'fb.watch']):
-        return 'Facebook'
+# YouTube channel pages; the optional last group is the selected tab
+YOUTUBE_CHANNEL_RE = re.compile(r'^/(?:channel/[^/]+|c/[^/]+|user/[^/]+|@[^/]+)(/[^/]+)?/?$')
 
-    # Default
-    else:
-        return 'Unknown Platform'
+def is_youtube_collection_url(url: str) -> bool:
+    """Check if the URL is a YouTube playlist or channel rather than a single video."""
+    parsed = urlparse(url)
+    if route_url(url).name != 'YouTube':
+        return False
+    if parsed.path.rstrip('/') == '/playlist':
+        return 'list' in dict(parse_qsl(parsed.query))
+    return bool(YOUTUBE_CHANNEL_RE.match(parsed.path))
 
-def is_supported_url(url: str) -> bool:
-    """Check if the URL is from a supported platform."""
-    # Platforms that actually work well with yt-dlp without authentication
-    supported_domains = [
-        'youtube.com', 'youtu.be', 'music.youtube.com',
-        'spotify.com',  # Now supported via spotdl
-        'tiktok.com',
-        'twitter.com', 'x.com',
-        'soundcloud.com',
-        'facebook.com', 'fb.watch',
-        'vimeo.com',
-        'dailymotion.com',
-        'twitch.tv'
+def youtube_collection_listing_url(url: str) -> str:
+    """Point channel URLs without a tab at their uploads so flat extraction lists videos."""
+    parsed = urlparse(url)
+    match = YOUTUBE_CHANNEL_RE.match(parsed.path)
+    if match and not match.group(1):
+        return urlunparse(parsed._replace(path=parsed.path.rstrip('/') + '/videos'))
+    return url
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {'si', 'feature', 'igshid', 'igsh', 'fbclid', 'gclid', 'ref', 'ref_src', 'is_from_webapp', 'sender_device'}
+
+def normalize_url(url: str) -> str:
+    """Normalize a URL for use as a cache key (scheme/host case, fragment, tracking params)."""
+    parsed = urlparse(url.strip())
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith('utm_')
     ]
+    path = parsed.path.rstrip('/') or '/'
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), path, parsed.params, urlencode(query), ''))
+
+# yt-dlp extractors whose URL patterns carry the same id the extractor reports
+CANONICAL_EXTRACTORS = {
+    'YouTube': ('Youtube',),
+    'TikTok': ('TikTok',),
+    'Twitter/X': ('Twitter',),
+    'Facebook': ('Facebook', 'FacebookReel'),
+    'Instagram': ('Instagram',),
+    'Vimeo': ('Vimeo',),
+    'Dailymotion': ('Dailymotion',),
+    'Twitch': ('TwitchVod', 'TwitchClips'),
+}
+
+# Cheap fallbacks when yt-dlp is unavailable or its patterns don't match
+YOUTUBE_ID_RE = re.compile(r'(?:youtu\.be/|/(?:shorts|embed|live|v)/|[?&]v=)([0-9A-Za-z_-]{11})(?![0-9A-Za-z_-])')
+SPOTIFY_ID_RE = re.compile(r'/(track|album|playlist)/([0-9A-Za-z]+)')
+HEURISTIC_ID_PATTERNS = {
+    'TikTok': ('TikTok', re.compile(r'/(?:video|photo)/(\d+)')),
+    'Twitter/X': ('Twitter', re.compile(r'/status(?:es)?/(\d+)')),
+}
+
+@functools.lru_cache(maxsize=None)
+def get_extractor_class(ie_key: str):
+    try:
+        return yt_dlp.extractor.get_info_extractor(ie_key)
+    except Exception:
+        return None
 
-    url_lower = url.lower()
-    return any(domain in url_lower for domain in supported_domains)
-
-def is_limited_support_url(url: str) -> bool:
-    """Check if the URL is from a platform with limited/conditional support."""
-    limited_domains = [
-        'instagram.com', 'instagr.am',  # Requires authentication
-    ]
+@functools.lru_cache(maxsize=4096)
+def canonicalize_url(url: str) -> Optional[Tuple[str, str]]:
+    """Map a URL to ``(extractor key, media id)`` without network access.
+
+    Variants of the same media (``youtu.be/X``, ``m.youtube.com/shorts/X``,
+    ``music.youtube.com/watch?v=X&si=...``) map to the same pair, which
+    matches the ``extractor_key``/``id`` yt-dlp reports after extraction.
+    Returns None if the media id can't be derived from the URL alone.
+    """
+    platform = route_url(url).name
+
+    if platform == 'Spotify':
+        match = SPOTIFY_ID_RE.search(url)
+        return ('spotify', match.group(2)) if match and match.group(1) == 'track' else None
+
+    for ie_key in CANONICAL_EXTRACTORS.get(platform, ()):
+        extractor = get_extractor_class(ie_key)
+        if extractor is None:
+            continue
+        try:
+            if extractor.suitable(url):
+                media_id = extractor.get_temp_id(url)
+                if media_id:
+                    return (extractor.ie_key(), str(media_id))
+        except Exception:
+            pass
+
+    if platform == 'YouTube' and not is_youtube_collection_url(url):
+        match = YOUTUBE_ID_RE.search(url)
+        if match:
+            return ('Youtube', match.group(1))
+
+    if platform in HEURISTIC_ID_PATTERNS:
+        ie_key, pattern = HEURISTIC_ID_PATTERNS[platform]
+        match = pattern.search(urlparse(url).path)
+        if match:
+            return (ie_key, match.group(1))
 
-    url_lower = url.lower()
-    return any(domain in url_lower for domain in limited_domains)
+    return None
 
-def is_spotify_url(url: str) -> bool:
-    """Check if the URL is from Spotify."""
-    return 'spotify.com' in url.lower()
+def canonical_media_key(url: str) -> Optional[str]:
+    """The "<extractor>:<media id>" cache key for a URL, if it can be derived offline."""
+    canonical = canonicalize_url(url)
+    return MediaCache.make_base_key(*canonical) if canonical else None
 
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human-readable format."""
@@ -475,99 +783,1139 @@ def format_file_size(size_bytes: int) -> str:
     else:
         return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
 
-# Queue implementation for processing downloads
-class Queue:
-    def __init__(self):
-        self.queue = []
-        self.running = False
-        self.lock = asyncio.Lock()
-    
-    async def run(self, executor):
+# Scheduler for processing downloads
+class DownloadScheduler:
+    """Run download jobs with a global and a per-user concurrency cap.
+
+    Jobs wait in a FIFO deque; a user already at their cap is skipped so
+    their later jobs don't hold up other users' jobs. A batch job (playlist,
+    album) only takes the user's slot; each of its entries is submitted as a
+    part, which takes a worker but not another user slot.
+    """
+
+    def __init__(self, max_workers: int, max_per_user: int):
+        self.max_workers = max(1, max_workers)
+        self.max_per_user = max(1, max_per_user)
+        self.pending = deque()
+        self.running = 0
+        self.running_per_user: Dict[int, int] = {}
+        self.tasks = set()
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _can_start(self, job: Dict) -> bool:
+        if job['uses_worker'] and self.running >= self.max_workers:
+            return False
+        return not job['uses_user_slot'] or self.running_per_user.get(job['user_id'], 0) < self.max_per_user
+
+    def _dispatch(self):
+        """Start as many pending jobs as the limits allow."""
+        if not self.pending:
+            return
+
+        still_pending = deque()
+        while self.pending:
+            job = self.pending.popleft()
+            if self._can_start(job):
+                if job['uses_worker']:
+                    self.running += 1
+                if job['uses_user_slot']:
+                    self.running_per_user[job['user_id']] = self.running_per_user.get(job['user_id'], 0) + 1
+                job['task'] = asyncio.create_task(self._run(job))
+                self.tasks.add(job['task'])
+                job['task'].add_done_callback(self.tasks.discard)
+            else:
+                still_pending.append(job)
+        self.pending = still_pending
+
+    async def _run(self, job: Dict):
+        wait = time.monotonic() - job['queued_at']
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
         try:
-            await executor()
+            result = await job['executor']()
+            self.completed += 1
+            if not job['future'].done():
+                job['future'].set_result(result)
+        except asyncio.CancelledError:
+            if not job['future'].done():
+                job['future'].cancel()
+            raise
         except Exception as e:
-            logger.error(f"Error in queue executor: {e}")
-    
-    async def bump(self):
-        async with self.lock:
-            if self.running:
-                return
-            self.running = True
-        
+            self.failed += 1
+            logger.error(f"Error in download job for user {job['user_id']}: {e}")
+            if not job['future'].done():
+                job['future'].set_exception(e)
+        finally:
+            if job['uses_worker']:
+                self.running -= 1
+            if job['uses_user_slot']:
+                remaining = self.running_per_user.get(job['user_id'], 1) - 1
+                if remaining > 0:
+                    self.running_per_user[job['user_id']] = remaining
+                else:
+                    self.running_per_user.pop(job['user_id'], None)
+            self._dispatch()
+
+    def position(self, job: Dict) -> int:
+        """1-based position of a job in the waiting line, or 0 if it has started."""
+        for index, pending_job in enumerate(self.pending):
+            if pending_job is job:
+                return index + 1
+        return 0
+
+    async def submit(
+        self,
+        user_id: int,
+        executor: Callable[[], Awaitable],
+        on_queued: Optional[Callable[[int], Awaitable]] = None,
+        batch: bool = False,
+        part: bool = False
+    ) -> asyncio.Future:
+        """Queue a job and return a future for its result without waiting for it.
+
+        If the job cannot start immediately, ``on_queued`` is awaited with the
+        job's position in line. ``batch`` and ``part`` mark a batch job and
+        one of its entries (see the class docstring).
+        """
+        job = {
+            'user_id': user_id,
+            'executor': executor,
+            'uses_worker': not batch,
+            'uses_user_slot': not part,
+            'future': asyncio.get_running_loop().create_future(),
+            'queued_at': time.monotonic(),
+            'task': None,
+        }
+        job['future'].add_done_callback(lambda future: self._on_future_done(job, future))
+        self.submitted += 1
+        self.pending.append(job)
+        self._dispatch()
+
+        position = self.position(job)
+        if position and on_queued:
+            try:
+                await on_queued(position)
+            except Exception as e:
+                debug_write(f"Could not send queue position: {e}")
+
+        return job['future']
+
+    async def run_part(self, user_id: int, executor: Callable[[], Awaitable]):
+        """Run one entry of a running batch job once a worker is free and return its result."""
+        return await (await self.submit(user_id, executor, part=True))
+
+    def _on_future_done(self, job: Dict, future: asyncio.Future):
+        if future.cancelled():
+            # Drop the job if it never started, otherwise stop it
+            if job in self.pending:
+                self.pending.remove(job)
+            elif job['task'] and not job['task'].done():
+                job['task'].cancel()
+        elif future.exception():
+            # Already logged in _run; mark the exception as retrieved
+            pass
+
+    async def shutdown(self, timeout: float = 30.0):
+        """Drop jobs that haven't started and give running ones ``timeout`` seconds to finish."""
+        while self.pending:
+            job = self.pending.popleft()
+            if not job['future'].done():
+                job['future'].cancel()
+
+        if not self.tasks:
+            return
+        tasks = list(self.tasks)
+        _, still_running = await asyncio.wait(tasks, timeout=timeout)
+        for task in still_running:
+            task.cancel()
+        if still_running:
+            logger.warning(f"Cancelled {len(still_running)} downloads still running at shutdown")
+            await asyncio.wait(still_running)
+
+    def stats(self) -> Dict:
+        started = self.completed + self.failed + self.running
+        return {
+            'queued': len(self.pending),
+            'running': self.running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_wait': self.total_wait / started if started else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+# Disk-backed cache for finished audio files
+class MediaCache:
+    """LRU cache of downloaded audio, bounded by total bytes and entry age.
+
+    Entries are keyed by ``<extractor>:<media id>:<variant>`` so the same
+    video requested through different links maps to the same file. The
+    variant names the selected output (see ``audio_variant``), or the
+    quality tier for spotdl downloads.
+
+    Changes only mark the index dirty; it is pruned and written at most
+    every ``save_interval`` seconds and on shutdown.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int, ttl_seconds: float, save_interval: float = 30.0):
+        self.cache_dir = cache_dir
+        self.index_file = cache_dir / "index.json"
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.save_interval = save_interval
+        self.dirty = False
+        self.save_handle: Optional[asyncio.TimerHandle] = None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        # Ordered least recently used first
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # Maps a requested URL to its "<extractor>:<media id>" base key
+        self.aliases: Dict[str, str] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.load_index()
+        self.prune()
+        self.save_index()
+
+    @staticmethod
+    def make_base_key(extractor_key: str, media_id: str) -> str:
+        return f"{extractor_key.lower()}:{media_id}"
+
+    @staticmethod
+    def make_key(base_key: str, variant: str) -> str:
+        return f"{base_key}:{variant}"
+
+    def load_index(self):
+        """Load the cache index from disk."""
+        if not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            entries = sorted(data.get("entries", {}).items(), key=lambda item: item[1].get("last_access", 0))
+            self.entries = OrderedDict(entries)
+            self.aliases = data.get("aliases", {})
+            self.total_bytes = sum(entry.get("size", 0) for entry in self.entries.values())
+        except Exception as e:
+            logger.error(f"Could not load media cache index: {e}")
+            self.entries = OrderedDict()
+            self.aliases = {}
+            self.total_bytes = 0
+
+    def _mark_dirty(self):
+        self.dirty = True
+        if self.save_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return  # Not running yet; the next save_index() writes it
+            self.save_handle = loop.call_later(self.save_interval, self._save_later)
+
+    def _save_later(self):
+        self.save_handle = None
+        self.prune()
+        self.save_index()
+
+    def save_index(self):
+        """Atomically write the cache index to disk if it changed."""
+        if self.save_handle:
+            self.save_handle.cancel()
+            self.save_handle = None
+        if not self.dirty:
+            return
+
+        # Drop aliases whose media is no longer cached at any quality
+        live_bases = {key.rsplit(":", 1)[0] for key in self.entries}
+        self.aliases = {url: base for url, base in self.aliases.items() if base in live_bases}
+
+        tmp_file = self.index_file.with_suffix(".tmp")
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"entries": self.entries, "aliases": self.aliases}, f)
+            os.replace(tmp_file, self.index_file)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Could not save media cache index: {e}")
+
+    def _is_expired(self, entry: Dict, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.get("created", 0) > self.ttl_seconds
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        self.total_bytes -= entry.get("size", 0)
+        self._mark_dirty()
+        try:
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+        except Exception as e:
+            logger.warning(f"Could not remove cached file {entry['file']}: {e}")
+
+    def prune(self):
+        """Remove expired entries, entries with missing files and anything over the size bound."""
+        now = time.time()
+        for key, entry in list(self.entries.items()):
+            if self._is_expired(entry, now) or not (self.cache_dir / entry["file"]).exists():
+                self._remove(key)
+        self._evict_over_size()
+
+    def _evict_over_size(self):
+        while self.entries and self.total_bytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            debug_write(f"Evicting {oldest_key} from media cache")
+            self._remove(oldest_key)
+
+    def resolve_alias(self, url: str) -> Optional[str]:
+        """Return the base key previously recorded for a URL, if any."""
+        return self.aliases.get(url)
+
+    def add_alias(self, url: str, base_key: str):
+        if self.aliases.get(url) != base_key:
+            self.aliases[url] = base_key
+            self._mark_dirty()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Look up a cached file, returning its entry with a ``path`` or None."""
+        entry = self.entries.get(key)
+        if entry:
+            path = self.cache_dir / entry["file"]
+            if self._is_expired(entry, time.time()) or not path.exists():
+                self._remove(key)
+                entry = None
+
+        if not entry:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry["last_access"] = time.time()
+        self.entries.move_to_end(key)
+        self._mark_dirty()
+        return dict(entry, path=path)
+
+    def put(self, key: str, source: Path, metadata: Dict) -> Optional[Path]:
+        """Move a finished file into the cache and return its new path.
+
+        Returns None if the file is too large to cache, leaving it in place.
+        """
+        size = source.stat().st_size
+        if size > self.max_bytes:
+            return None
+
+        if key in self.entries:
+            self._remove(key)
+
+        filename = hashlib.sha1(key.encode("utf-8")).hexdigest() + source.suffix
+        destination = self.cache_dir / filename
+        shutil.move(str(source), str(destination))
+
+        now = time.time()
+        self.entries[key] = dict(metadata, file=filename, size=size, created=now, last_access=now)
+        self.total_bytes += size
+        self._mark_dirty()
+        self._evict_over_size()
+        return destination
+
+# Index of Telegram file_ids for already uploaded audio
+class FileIdIndex:
+    """Persistent map from ``<media key>:<variant>`` to a Telegram file_id.
+
+    Stored as an append-only log of ``key<TAB>json`` lines so a write is a
+    single append and loading is one pass over the file. The log is
+    compacted once superseded lines outnumber live records.
+    """
+
+    ALIAS_PREFIX = "@"
+
+    def __init__(self, index_file: Path):
+        self.index_file = index_file
+        self.records: Dict[str, Dict] = {}
+        self.aliases: Dict[str, str] = {}
+        self.log_lines = 0
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """Replay the log file into memory."""
+        if not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    key, _, value = line.rstrip("\n").partition("\t")
+                    if not key:
+                        continue
+                    self.log_lines += 1
+                    self._apply(key, json.loads(value) if value else None)
+        except Exception as e:
+            logger.error(f"Could not load file_id index: {e}")
+
+    def _apply(self, key: str, value):
+        if key.startswith(self.ALIAS_PREFIX):
+            url = key[len(self.ALIAS_PREFIX):]
+            if value:
+                self.aliases[url] = value
+            else:
+                self.aliases.pop(url, None)
+        elif value:
+            self.records[key] = value
+        else:
+            self.records.pop(key, None)
+
+    def _append(self, key: str, value):
+        self._apply(key, value)
+        try:
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(f"{key}\t{json.dumps(value) if value else ''}\n")
+            self.log_lines += 1
+        except Exception as e:
+            logger.error(f"Could not write file_id index: {e}")
+
+        if self.log_lines > 2 * (len(self.records) + len(self.aliases)) + 100:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the log with only the live records."""
+        tmp_file = self.index_file.with_suffix(".tmp")
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for url, base_key in self.aliases.items():
+                    f.write(f"{self.ALIAS_PREFIX}{url}\t{json.dumps(base_key)}\n")
+                for key, value in self.records.items():
+                    f.write(f"{key}\t{json.dumps(value)}\n")
+            os.replace(tmp_file, self.index_file)
+            self.log_lines = len(self.records) + len(self.aliases)
+        except Exception as e:
+            logger.error(f"Could not compact file_id index: {e}")
+
+    def get(self, key: str) -> Optional[Dict]:
+        record = self.records.get(key)
+        if record:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return record
+
+    def set(self, key: str, file_id: str, title: str, caption: str):
+        self._append(key, {"file_id": file_id, "title": title, "caption": caption})
+
+    def remove(self, key: str):
+        if key in self.records:
+            self._append(key, None)
+
+    def resolve_alias(self, url: str) -> Optional[str]:
+        return self.aliases.get(url)
+
+    def add_alias(self, url: str, base_key: str):
+        if self.aliases.get(url) != base_key:
+            self._append(f"{self.ALIAS_PREFIX}{url}", base_key)
+
+# Short-lived cache of extracted info dicts
+class InfoCache:
+    """In-memory LRU of yt-dlp info dicts keyed by normalized URL.
+
+    Lets the download reuse the extraction done for the quality preview.
+    Entries expire quickly because format URLs are signed and time-limited.
+    """
+
+    # Large fields that are never needed to download audio
+    STRIPPED_KEYS = ('automatic_captions', 'subtitles', 'heatmap', 'comments', 'chapters')
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[Dict]:
+        key = normalize_url(url)
+        entry = self.entries.get(key)
+        if entry and time.monotonic() - entry[0] <= self.ttl_seconds:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        if entry:
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, url: str, info: Dict):
+        if self.max_entries <= 0:
+            return
+        key = normalize_url(url)
+        info = {k: v for k, v in info.items() if k not in self.STRIPPED_KEYS}
+        self.entries[key] = (time.monotonic(), info)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+# Requests waiting for a button press
+class PendingRequests:
+    """Short opaque tokens for inline keyboard callbacks.
+
+    Telegram limits callback_data to 64 bytes, so buttons carry a token and
+    the URL, platform and preview summary stay here until the user picks an
+    option or the entry expires. The summary feeds the download's size
+    planning and title; the full info dict stays in the bounded InfoCache
+    and is looked up again when a button is pressed.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 2000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self.expired = 0
+
+    def add(self, entry: Dict) -> str:
+        token = uuid.uuid4().hex[:12]
+        self.entries[token] = (time.monotonic(), entry)
+        self._evict()
+        return token
+
+    def get(self, token: str) -> Optional[Dict]:
+        item = self.entries.get(token)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > self.ttl_seconds:
+            del self.entries[token]
+            self.expired += 1
+            return None
+        return item[1]
+
+    def _evict(self):
+        # Entries are in creation order, so expired ones are at the front
+        now = time.monotonic()
+        while self.entries:
+            token, (created, _) = next(iter(self.entries.items()))
+            if now - created <= self.ttl_seconds and len(self.entries) <= self.max_entries:
+                break
+            del self.entries[token]
+            self.expired += 1
+
+# Two-tier cache for link metadata
+# yt-dlp errors a retry won't fix; only these are cached as failures
+PERMANENT_EXTRACTION_ERRORS = (
+    'video unavailable', 'private video', 'this video is private', 'is not available',
+    'has been removed', 'does not exist', 'account has been terminated', 'unsupported url',
+    'http error 404', 'http error 410',
+)
+
+def is_permanent_extraction_error(error: Exception) -> bool:
+    """Whether an extraction error means the media itself is gone or private, not a transient failure."""
+    message = str(error).lower()
+    return any(marker in message for marker in PERMANENT_EXTRACTION_ERRORS)
+
+class MetadataCache:
+    """Cache of display metadata (title, uploader, duration) per link.
+
+    Tier one is an in-process LRU, tier two a SQLite table that survives
+    restarts, written on a single writer thread so the event loop never
+    waits on disk. Permanent failures are cached briefly too, so a broken
+    link pasted in several chats is only fetched once.
+    """
+
+    # Returned by get() when nothing is cached for a key
+    MISSING = object()
+
+    # How long metadata stays valid per platform, in seconds
+    PLATFORM_TTLS = {
+        'YouTube': 24 * 3600,
+        'Spotify': 7 * 24 * 3600,
+        'SoundCloud': 24 * 3600,
+        'TikTok': 6 * 3600,
+        'Twitter/X': 6 * 3600,
+        'Instagram': 6 * 3600,
+        'Facebook': 6 * 3600,
+    }
+    DEFAULT_TTL = 6 * 3600
+    NEGATIVE_TTL = 120
+
+    def __init__(self, db_file: Path, max_memory_entries: int = 1024):
+        self.max_memory_entries = max_memory_entries
+        self.memory: "OrderedDict[str, Tuple[float, Optional[Dict]]]" = OrderedDict()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="metadata-writer")
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(str(db_file), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+        )
+        self.db.execute("DELETE FROM metadata WHERE expires_at < ?", (time.time(),))
+        self.db.commit()
+
+    def _remember(self, key: str, expires_at: float, value: Optional[Dict]):
+        self.memory[key] = (expires_at, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key: str):
+        """Return cached metadata, None for a cached failure, or MISSING."""
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry and entry[0] >= now:
+            self.memory.move_to_end(key)
+            if entry[1] is None:
+                self.negative_hits += 1
+            else:
+                self.memory_hits += 1
+            return entry[1]
+
+        try:
+            row = self.db.execute(
+                "SELECT value, expires_at FROM metadata WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Metadata cache read failed: {e}")
+            row = None
+
+        if row:
+            value = json.loads(row[0]) if row[0] else None
+            self._remember(key, row[1], value)
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.disk_hits += 1
+            return value
+
+        self.misses += 1
+        return self.MISSING
+
+    def put(self, key: str, value: Dict, platform: str):
+        ttl = self.PLATFORM_TTLS.get(platform, self.DEFAULT_TTL)
+        self._store(key, value, time.time() + ttl)
+
+    def put_failure(self, key: str):
+        self._store(key, None, time.time() + self.NEGATIVE_TTL)
+
+    def _store(self, key: str, value: Optional[Dict], expires_at: float):
+        self._remember(key, expires_at, value)
+        self.writer.submit(
+            self._write_row, key, json.dumps(value) if value is not None else None, expires_at
+        )
+
+    def _write_row(self, key: str, value: Optional[str], expires_at: float):
         try:
-            while self.queue:
-                next_up = self.queue.pop(0)
-                if next_up:
-                    await self.run(next_up)
+            with self.db:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO metadata (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+        except Exception as e:
+            logger.error(f"Metadata cache write failed: {e}")
+
+    def hit_rate(self) -> float:
+        hits = self.memory_hits + self.disk_hits + self.negative_hits
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+    def close(self):
+        """Finish queued writes and close the database."""
+        self.writer.shutdown(wait=True)
+        self.db.close()
+
+# Coalescing of identical in-flight work
+class SingleFlight:
+    """Share one execution between concurrent callers asking for the same key.
+
+    The result stays available to late joiners until the last caller is
+    done with it, then the cleanup callback runs once.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, Dict] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    @contextlib.asynccontextmanager
+    async def join(self, key: str, producer: Callable[[], Awaitable], cleanup: Optional[Callable] = None):
+        """Yield ``(result, coalesced)`` for a key, producing it if nobody else is."""
+        call = self.calls.get(key)
+        coalesced = call is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            call = {'task': asyncio.create_task(producer()), 'waiters': 0}
+            self.calls[key] = call
+            self.started += 1
+
+        call['waiters'] += 1
+        try:
+            result = await asyncio.shield(call['task'])
+            yield result, coalesced
         finally:
-            async with self.lock:
-                self.running = False
-    
-    def add(self, executor):
-        self.queue.append(executor)
-        asyncio.create_task(self.bump())
+            call['waiters'] -= 1
+            if call['waiters'] == 0:
+                if self.calls.get(key) is call:
+                    del self.calls[key]
+
+                task = call['task']
+                if not task.done():
+                    # Every caller gave up, so stop the work
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None and cleanup:
+                    cleanup(task.result())
+
+# Worker tier for yt-dlp jobs
+class YtdlWorkerPool:
+    """Run yt-dlp extraction and postprocessing in warm worker processes.
+
+    Keeps CPU-heavy extractor parsing and FFmpeg postprocessing off the
+    event loop's thread pool. Jobs are plain dicts (see ytdl_worker.run_job)
+    and results are sanitized info dicts. A crashed worker breaks the whole
+    process pool, failing every job outstanding on it; the pool is rebuilt
+    for the next job.
+    """
+
+    def __init__(self, max_workers: int, temp_dir: Path, kill_grace: float = 5.0):
+        self.max_workers = max_workers
+        self.temp_dir = temp_dir
+        self.kill_grace = kill_grace
+        self.executor = None
+        self.closed = False
+        # Executors whose hung worker was killed on purpose
+        self.retired = weakref.WeakSet()
+
+        # Metrics
+        self.jobs = 0
+        self.cancelled = 0
+        self.crashes = 0
+        self.killed = 0
+
+    def start(self):
+        """Start the worker processes and import yt-dlp in each of them."""
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+
+        if self.max_workers <= 0:
+            self.executor = ThreadPoolExecutor(thread_name_prefix="ytdl")
+            logger.info("Running yt-dlp jobs in threads")
+            return
+
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=ytdl_worker.init_worker
+        )
+        for _ in range(self.max_workers):
+            self.executor.submit(ytdl_worker.warm_up)
+        logger.info(f"Started {self.max_workers} yt-dlp worker processes")
+
+    def _restart(self, broken_executor):
+        """Replace a broken process pool, unless that already happened."""
+        if self.executor is not broken_executor or self.closed:
+            return
+        logger.error("yt-dlp worker process crashed, restarting worker pool")
+        try:
+            broken_executor.shutdown(wait=False, cancel_futures=True)
+        except Exception as e:
+            debug_write(f"Error shutting down broken worker pool: {e}")
+        self.start()
+
+    def _submit(self, job: Dict):
+        executor = self.executor
+        try:
+            return executor, executor.submit(ytdl_worker.run_job, job)
+        except BrokenProcessPool:
+            self.crashes += 1
+            self._restart(executor)
+            return self.executor, self.executor.submit(ytdl_worker.run_job, job)
+
+    def _kill_if_running(self, executor, concurrent_future, pid_file: Path):
+        """Recycle the worker of a cancelled job that didn't stop by itself.
+
+        The cancel marker is only seen by progress hooks, so a job stuck
+        before its first hook (a hanging extraction) would hold the worker
+        forever. New jobs go to a fresh pool; jobs that were still on the old
+        one are resubmitted by ``run`` once it breaks.
+        """
+        if concurrent_future.done() or not isinstance(executor, ProcessPoolExecutor):
+            return
+        try:
+            pid = int(pid_file.read_text())
+        except (OSError, ValueError):
+            # Not picked up by a worker yet; it will see the cancel marker on start
+            return
+
+        logger.warning(f"yt-dlp job ignored cancellation, killing worker process {pid}")
+        self.killed += 1
+        self.retired.add(executor)
+        if executor is self.executor and not self.closed:
+            self.start()
+        try:
+            os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+        except OSError as e:
+            debug_write(f"Could not kill yt-dlp worker {pid}: {e}")
+        executor.shutdown(wait=False)
+
+    async def run(self, job: Dict, timeout: float) -> Dict:
+        """Run a job in the pool, cancelling it on timeout or task cancellation.
+
+        A job that keeps running ``kill_grace`` seconds after being cancelled
+        has its worker process killed.
+        """
+        if self.closed:
+            raise RuntimeError("yt-dlp worker pool is shut down")
+        if not self.executor:
+            self.start()
+
+        token = uuid.uuid4().hex
+        cancel_file = self.temp_dir / f"cancel_{token}"
+        pid_file = self.temp_dir / f"pid_{token}"
+        job = dict(job, cancel_file=str(cancel_file), pid_file=str(pid_file))
+        deadline = time.monotonic() + timeout
+        self.jobs += 1
+
+        while True:
+            executor, concurrent_future = self._submit(job)
+
+            # The cancel marker must outlive the job, so remove it only once the worker is done
+            def remove_markers(_):
+                cancel_file.unlink(missing_ok=True)
+                pid_file.unlink(missing_ok=True)
+            concurrent_future.add_done_callback(remove_markers)
+
+            try:
+                return await asyncio.wait_for(
+                    asyncio.wrap_future(concurrent_future),
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                self.cancelled += 1
+                if not concurrent_future.cancel() and not concurrent_future.done():
+                    # Already running: ask the worker to stop at its next progress hook,
+                    # and kill it if it doesn't
+                    cancel_file.touch()
+                    asyncio.get_running_loop().call_later(
+                        self.kill_grace, self._kill_if_running, executor, concurrent_future, pid_file
+                    )
+                raise
+            except BrokenProcessPool:
+                if executor in self.retired and not self.closed:
+                    # Another job's worker was killed; run this one again in the new pool
+                    continue
+                self.crashes += 1
+                self._restart(executor)
+                raise Exception("yt-dlp worker crashed while processing this link")
+
+    def shutdown(self):
+        self.closed = True
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.max_workers,
+            'jobs': self.jobs,
+            'cancelled': self.cancelled,
+            'crashes': self.crashes,
+            'killed': self.killed,
+        }
+
+# Streaming download-to-FFmpeg pipeline
+class StreamingTranscoder:
+    """Let FFmpeg read a media URL directly and encode it.
+
+    Encoding starts as soon as the first bytes arrive instead of after the
+    whole source file has landed on disk, and only the encoded output is
+    ever written to the temp directory.
+    """
+
+    def __init__(self, ffmpeg_binary: str):
+        self.ffmpeg_binary = ffmpeg_binary
+        self.streamed = 0
+        self.failed = 0
+        self.total_time = 0.0
+
+    async def transcode_url(self, source_url: str, output: Path, codec_args: List[str], timeout: float,
+                            headers: Optional[Dict[str, str]] = None) -> Path:
+        """Let FFmpeg read a direct media URL and write ``output``."""
+        input_args = ["-reconnect", "1", "-reconnect_streamed", "1"]
+        if headers:
+            input_args += ["-headers", "".join(f"{name}: {value}\r\n" for name, value in headers.items())]
+        input_args += ["-i", source_url]
+        return await self._run(input_args, output, codec_args, timeout)
+
+    async def _run(self, input_args: List[str], output: Path, codec_args: List[str], timeout: float) -> Path:
+        start = time.monotonic()
+        ffmpeg_cmd = [
+            self.ffmpeg_binary, "-hide_banner", "-loglevel", "error",
+            *input_args, "-vn", "-map_metadata", "-1", *codec_args, "-y", str(output)
+        ]
+
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *ffmpeg_cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+        except BaseException:
+            # Timeout, cancellation or spawn failure: don't leave FFmpeg running
+            if process and process.returncode is None:
+                process.kill()
+            output.unlink(missing_ok=True)
+            self.failed += 1
+            raise
+
+        if process.returncode != 0:
+            output.unlink(missing_ok=True)
+            self.failed += 1
+            errors = stderr.decode(errors='replace').strip()
+            raise RuntimeError(f"Streaming transcode failed: {errors[-300:]}")
+
+        if not output.exists():
+            self.failed += 1
+            raise FileNotFoundError("Streaming transcode produced no file")
+
+        self.streamed += 1
+        self.total_time += time.monotonic() - start
+        return output
+
+class ResolverStats:
+    """Latency and outcome of each resolver (Cobalt, yt-dlp) per platform."""
+
+    def __init__(self):
+        # (platform, resolver) -> [successes, failures, total seconds of successes]
+        self.paths: Dict[Tuple[str, str], List] = {}
+
+    def record(self, platform: str, resolver: str, seconds: float, ok: bool):
+        entry = self.paths.setdefault((platform, resolver), [0, 0, 0.0])
+        if ok:
+            entry[0] += 1
+            entry[2] += seconds
+        else:
+            entry[1] += 1
+
+    def summary(self) -> List[str]:
+        lines = []
+        for (platform, resolver), (successes, failures, total) in sorted(self.paths.items()):
+            average = total / successes if successes else 0.0
+            lines.append(f"{platform} via {resolver}: {successes} ok, {failures} failed, avg {average:.1f}s")
+        return lines
 
 # Translation service
 class TranslationService:
-    def __init__(self, api_key: str, translations_file: Path):
+    """Translates bot texts with OpenAI.
+
+    One async client is shared by all calls. Strings requested for the same
+    language within ``batch_window`` seconds are sent in a single request.
+    Results are kept in memory and stored row by row in SQLite.
+    """
+
+    MODEL = "gpt-4o-mini"
+
+    def __init__(self, api_key: str, db_file: Path, legacy_file: Optional[Path] = None,
+                 base_url: Optional[str] = None, batch_window: float = 0.05, max_batch: int = 16):
         self.api_key = api_key
-        self.translations_file = translations_file
+        self.base_url = base_url or None
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.client = None
+
+        # lang -> {text: future} of strings waiting for the next batch
+        self.pending: Dict[str, Dict[str, asyncio.Future]] = {}
+        self.flush_tasks: Dict[str, asyncio.Task] = {}
+        self.tasks = set()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translations-writer")
+
+        self.requests = 0
+        self.cache_hits = 0
+        self.api_calls = 0
+
+        self.db = sqlite3.connect(str(db_file), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "text TEXT, lang TEXT, translated TEXT, PRIMARY KEY (text, lang))"
+        )
+        self.db.commit()
+
         self.saved_translations = self.load_translations()
-    
+        if not self.saved_translations and legacy_file and legacy_file.exists():
+            self.import_legacy_file(legacy_file)
+
     def load_translations(self) -> Dict:
-        """Load saved translations from file."""
-        if self.translations_file.exists():
-            with open(self.translations_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-    
-    async def save_translations(self):
-        """Save translations to file."""
-        with open(self.translations_file, 'w', encoding='utf-8') as f:
-            json.dump(self.saved_translations, f, indent=2)
-    
+        """Load saved translations from the database."""
+        translations = {}
+        for text, lang, translated in self.db.execute("SELECT text, lang, translated FROM translations"):
+            translations.setdefault(text, {})[lang] = translated
+        return translations
+
+    def import_legacy_file(self, legacy_file: Path):
+        """Copy translations from the old JSON file into the database."""
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception as e:
+            logger.error(f"Could not read legacy translations file {legacy_file}: {e}")
+            return
+
+        rows = [(text, lang, translated) for text, langs in legacy.items() for lang, translated in langs.items()]
+        self._write_rows(rows)
+        self.saved_translations = self.load_translations()
+        logger.info(f"Imported {len(rows)} translations from {legacy_file}")
+
+    def _write_rows(self, rows: List[Tuple[str, str, str]]):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO translations (text, lang, translated) VALUES (?, ?, ?)", rows)
+
+    async def save_translations(self, lang: str, translations: Dict[str, str]):
+        """Store new translations for a language."""
+        for text, translated in translations.items():
+            self.saved_translations.setdefault(text, {})[lang] = translated
+
+        rows = [(text, lang, translated) for text, translated in translations.items()]
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.writer, self._write_rows, rows)
+        except Exception as e:
+            logger.error(f"Failed to save translations: {e}")
+
+    def get_client(self):
+        if self.client is None:
+            self.client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self.client
+
     async def translate_text(self, text: str, lang: str) -> str:
         """Translate text to the specified language."""
         if not self.api_key:
             return text
-        
+
+        self.requests += 1
+
         # Check if we already have this translation
         if text in self.saved_translations and lang in self.saved_translations[text]:
+            self.cache_hits += 1
             return self.saved_translations[text][lang]
-        
+
+        # Join the next batch for this language; identical strings share a result
+        batch = self.pending.setdefault(lang, {})
+        future = batch.get(text)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            batch[text] = future
+
+            if len(batch) >= self.max_batch:
+                # A full batch goes out right away
+                del self.pending[lang]
+                self._spawn(self._send_batch(lang, batch))
+            elif lang not in self.flush_tasks:
+                self.flush_tasks[lang] = self._spawn(self._flush_later(lang))
+
+        return await asyncio.shield(future)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _flush_later(self, lang: str):
         try:
-            client = openai.OpenAI(api_key=self.api_key)
-            
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"Translate text to the following IETF language tag: {lang}. "
-                                  f"Keep the HTML formatting. Do not add any other text or explanations"
-                    },
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.2,
-                max_tokens=256
-            )
-            
-            translated = response.choices[0].message.content
-            
-            if not translated:
-                return text
-            
-            # Save the translation
-            if text not in self.saved_translations:
-                self.saved_translations[text] = {}
-            self.saved_translations[text][lang] = translated
-            
-            await self.save_translations()
-            return translated
-            
+            await asyncio.sleep(self.batch_window)
+        finally:
+            self.flush_tasks.pop(lang, None)
+        await self._send_batch(lang, self.pending.pop(lang, {}))
+
+    async def _send_batch(self, lang: str, batch: Dict[str, asyncio.Future]):
+        if not batch:
+            return
+
+        try:
+            translations = await self.request_translations(list(batch), lang)
         except Exception as e:
             logger.error(f"Translation error: {e}")
-            return text
+            translations = {}
+
+        if translations:
+            await self.save_translations(lang, translations)
+
+        for text, future in batch.items():
+            if not future.done():
+                future.set_result(translations.get(text, text))
+
+    async def request_translations(self, texts: List[str], lang: str) -> Dict[str, str]:
+        """Translate several strings to one language, in one request when possible."""
+        if len(texts) == 1:
+            translated = await self.request_single(texts[0], lang)
+            return {texts[0]: translated} if translated else {}
+
+        self.api_calls += 1
+        response = await self.get_client().chat.completions.create(
+            model=self.MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": f"Translate each string in the JSON array to the following IETF language tag: {lang}. "
+                              f"Keep the HTML formatting. Reply with a JSON object {{\"translations\": [...]}} "
+                              f"holding the translated strings in the same order. Do not add any other text or explanations"
+                },
+                {"role": "user", "content": json.dumps(texts, ensure_ascii=False)}
+            ],
+            temperature=0.2,
+            max_tokens=256 * len(texts),
+            response_format={"type": "json_object"}
+        )
+
+        try:
+            translated = json.loads(response.choices[0].message.content or "{}").get("translations")
+        except (ValueError, AttributeError):
+            translated = None
+
+        if isinstance(translated, list) and len(translated) == len(texts):
+            return {text: value for text, value in zip(texts, translated) if isinstance(value, str) and value}
+
+        # The batch reply was unusable; translate the strings one by one
+        logger.warning(f"Batch translation to {lang} returned an unexpected reply, retrying individually")
+        results = await asyncio.gather(*(self.request_single(text, lang) for text in texts), return_exceptions=True)
+        return {
+            text: result for text, result in zip(texts, results)
+            if isinstance(result, str) and result
+        }
+
+    async def request_single(self, text: str, lang: str) -> Optional[str]:
+        self.api_calls += 1
+        response = await self.get_client().chat.completions.create(
+            model=self.MODEL,
+            messages=[
+                {
+                    "role": "system",
+                    "content": f"Translate text to the following IETF language tag: {lang}. "
+                              f"Keep the HTML formatting. Do not add any other text or explanations"
+                },
+                {"role": "user", "content": text}
+            ],
+            temperature=0.2,
+            max_tokens=256
+        )
+        return response.choices[0].message.content
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        if self.client is not None:
+            await self.client.close()
+        self.writer.shutdown(wait=True)
+        self.db.close()
 
 # YT-DLP Updater
 class Updater:
@@ -633,11 +1981,144 @@ class Updater:
             self.updating = False
             self._schedule_next_update()
 
+# Shared outbound HTTP client
+class HttpClient:
+    """Keep-alive connection pool for outbound HTTP requests.
+
+    Concurrent requests per host are capped. Connection errors, 429 and 5xx
+    responses are retried with jittered exponential backoff.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_connections: int = 20, max_per_host: int = 6, retries: int = 2,
+                 timeout: float = 10.0, backoff: float = 0.5):
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            follow_redirects=True
+        )
+
+        self.requests = 0
+        self.connections = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def _trace(self, event_name: str, info: Dict):
+        # Count new TCP connections; every other request reused a pooled one
+        if event_name == "connection.connect_tcp.complete":
+            self.connections += 1
+
+    @staticmethod
+    def retry_after_seconds(value: Optional[str]) -> float:
+        """Seconds to wait from a Retry-After header, given as seconds or an HTTP date."""
+        if not value:
+            return 0.0
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return 0.0
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc.lower()
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self.host_limits[host]
+
+    async def request(self, method: str, url: str, retries: Optional[int] = None, **kwargs) -> "httpx.Response":
+        """Send a request, retrying transient failures. Raises the last error once retries run out."""
+        retries = self.retries if retries is None else retries
+        extensions = dict(kwargs.pop('extensions', {}), trace=self._trace)
+
+        for attempt in range(retries + 1):
+            try:
+                async with self._host_limit(url):
+                    self.requests += 1
+                    response = await self.client.request(method, url, extensions=extensions, **kwargs)
+                if response.status_code not in self.RETRY_STATUSES:
+                    return response
+                if attempt == retries:
+                    self.failed += 1
+                    return response
+                delay = self.retry_after_seconds(response.headers.get('retry-after'))
+            except httpx.TransportError:
+                if attempt == retries:
+                    self.failed += 1
+                    raise
+                delay = 0
+
+            self.retried += 1
+            await asyncio.sleep(max(delay, random.uniform(0, self.backoff * 2 ** attempt)))
+
+    async def get(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'connections': self.connections,
+            'reused': max(0, self.requests - self.connections),
+            'retried': self.retried,
+            'failed': self.failed,
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
 # Cobalt API Integration
+class CobaltInstance:
+    """Health, latency and circuit breaker state of one Cobalt instance."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.info = None
+        self.healthy = False
+        self.latency = None  # EWMA of response time in seconds
+        self.failures = 0  # Consecutive failures
+        self.open_until = 0.0  # Circuit breaker is open until this time
+        self.probing = False  # A half-open trial request is in flight
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, now: float) -> bool:
+        """Whether requests may be sent, allowing one trial once the breaker cools down."""
+        if not self.healthy:
+            return False
+        if self.open_until <= 0:
+            return True
+        return now >= self.open_until and not self.probing
+
 class CobaltAPI:
-    def __init__(self, instance_url: str):
-        self.instance_url = instance_url
-        self.instance_info = None
+    """Pool of Cobalt instances.
+
+    Instances are health-checked in the background. Each request goes to the
+    healthy instance with the lowest latency average; instances that keep
+    failing are ejected for a cooldown and then tried with a single request.
+    """
+
+    def __init__(self, instance_urls: List[str], http: HttpClient, health_interval: float = 60.0,
+                 failure_threshold: int = 3, cooldown: float = 30.0, alpha: float = 0.3):
+        self.instances = [CobaltInstance(url) for url in instance_urls if url]
+        self.http = http
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.health_task: Optional[asyncio.Task] = None
         
         # Initialize regexes for matching URLs
         self.cobalt_regexes = [
@@ -645,28 +2126,92 @@ class CobaltAPI:
             re.compile(r'^(?:https:\/\/)?(?:www\.)?tiktok\.com\/@\w+\/photo\/\d+.*'),
             # Add more regexes as needed
         ]
-    
-    async def check_instance(self) -> bool:
-        """Check if the Cobalt instance is valid and available."""
-        if not self.instance_url:
-            return False
-            
+
+    @property
+    def instance_info(self) -> Optional[Dict]:
+        """Info of the preferred instance, or None if no instance is usable."""
+        instance = self.pick_instance(reserve=False)
+        return instance.info if instance else None
+
+    def _record_success(self, instance: CobaltInstance, seconds: float):
+        instance.latency = seconds if instance.latency is None else (
+            self.alpha * seconds + (1 - self.alpha) * instance.latency
+        )
+        if instance.open_until:
+            logger.info(f"Cobalt instance {instance.url} recovered")
+        instance.failures = 0
+        instance.open_until = 0.0
+        instance.probing = False
+
+    def _record_failure(self, instance: CobaltInstance):
+        instance.failures += 1
+        instance.errors += 1
+        instance.probing = False
+        if instance.open_until or instance.failures >= self.failure_threshold:
+            if not instance.open_until:
+                logger.warning(f"Cobalt instance {instance.url} ejected after {instance.failures} failures")
+            instance.open_until = time.monotonic() + self.cooldown
+
+    async def check_instance(self, instance: Optional[CobaltInstance] = None) -> bool:
+        """Check one instance, or all of them; returns whether any instance is available."""
+        if instance is None:
+            if not self.instances:
+                return False
+            results = await asyncio.gather(*(self.check_instance(item) for item in self.instances))
+            return any(results)
+
+        start = time.monotonic()
         try:
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: requests.get(self.instance_url, timeout=5)
-            )
+            response = await self.http.get(instance.url, timeout=5, retries=0)
             
             if response.status_code != 200:
-                logger.warning("Invalid Cobalt instance URL")
+                logger.warning(f"Invalid Cobalt instance URL: {instance.url}")
+                instance.healthy = False
                 return False
                 
-            self.instance_info = response.json()
-            logger.info(f"Cobalt instance found, version {self.instance_info['cobalt']['version']}")
+            info = response.json()
+            if not instance.healthy:
+                logger.info(f"Cobalt instance {instance.url} found, version {info['cobalt']['version']}")
+            instance.info = info
+            instance.healthy = True
+            self._record_success(instance, time.monotonic() - start)
             return True
             
         except Exception as e:
-            logger.error(f"Error checking Cobalt instance: {e}")
+            logger.error(f"Error checking Cobalt instance {instance.url}: {e}")
+            if instance.info is None:
+                instance.healthy = False
+            self._record_failure(instance)
             return False
+
+    def start_health_checks(self):
+        """Re-check all instances every ``health_interval`` seconds."""
+        if self.instances and not self.health_task:
+            self.health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_instance()
+            except Exception as e:
+                logger.error(f"Cobalt health check failed: {e}")
+
+    def pick_instance(self, reserve: bool = True, exclude: Tuple = ()) -> Optional[CobaltInstance]:
+        """Return the fastest usable instance; ``reserve`` claims a half-open trial slot."""
+        now = time.monotonic()
+        candidates = [
+            instance for instance in self.instances
+            if instance not in exclude and instance.available(now)
+        ]
+        if not candidates:
+            return None
+
+        # Closed breakers first, then by latency
+        instance = min(candidates, key=lambda item: (item.open_until > 0, item.latency or 0.0))
+        if reserve and instance.open_until:
+            instance.probing = True
+        return instance
     
     def matches_url(self, url: str) -> bool:
         """Check if URL can be processed by Cobalt."""
@@ -675,24 +2220,70 @@ class CobaltAPI:
             
         return any(regex.match(url) for regex in self.cobalt_regexes)
     
-    async def resolve_url(self, url: str) -> Dict:
-        """Resolve a URL using Cobalt API."""
-        try:
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, 
-                lambda: requests.post(
-                    self.instance_url,
+    async def resolve_url(self, url: str, attempts: int = 2) -> Dict:
+        """Resolve a URL using the Cobalt API, failing over to the next instance."""
+        tried = []
+        error = "no Cobalt instance available"
+        for _ in range(attempts):
+            instance = self.pick_instance(exclude=tuple(tried))
+            if not instance:
+                break
+            tried.append(instance)
+
+            start = time.monotonic()
+            instance.requests += 1
+            try:
+                response = await self.http.post(
+                    instance.url,
                     headers={"Content-Type": "application/json", "Accept": "application/json"},
-                    json={"url": url},
-                    timeout=10
+                    json={"url": url, "downloadMode": "audio", "audioFormat": "best"},
+                    timeout=10,
+                    retries=0
                 )
-            )
-            
-            return response.json()
-            
-        except Exception as e:
-            logger.error(f"Error resolving URL with Cobalt: {e}")
-            return {"status": "error", "error": {"code": "request_failed", "message": str(e)}}
+                if response.status_code >= 500 or response.status_code == 429:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+
+                result = response.json()
+                self._record_success(instance, time.monotonic() - start)
+                return result
+                
+            except Exception as e:
+                logger.error(f"Error resolving URL with Cobalt instance {instance.url}: {e}")
+                self._record_failure(instance)
+                error = str(e)
+
+        return {"status": "error", "error": {"code": "request_failed", "message": error}}
+
+    def stats(self) -> List[str]:
+        now = time.monotonic()
+        lines = []
+        for instance in self.instances:
+            if not instance.healthy:
+                state = "down"
+            elif instance.open_until > now:
+                state = "ejected"
+            elif instance.open_until:
+                state = "probing"
+            else:
+                state = "ok"
+            latency = f"{instance.latency * 1000:.0f}ms" if instance.latency is not None else "n/a"
+            lines.append(f"{instance.url}: {state}, {latency}, {instance.requests} requests, {instance.errors} errors")
+        return lines
+
+    async def close(self):
+        if self.health_task:
+            self.health_task.cancel()
+
+    @staticmethod
+    def get_audio_url(result: Dict) -> Optional[str]:
+        """Pick the direct audio URL out of a resolve_url response."""
+        status = result.get("status")
+        if status in ("tunnel", "redirect", "stream"):
+            return result.get("url")
+        if status == "picker":
+            # Photo slideshows come back as a picker with the soundtrack separately
+            return result.get("audio")
+        return None
 
 # Media utilities
 def get_thumbnail(thumbnails: List[Dict]) -> Optional[str]:
@@ -727,6 +2318,538 @@ def get_thumbnail(thumbnails: List[Dict]) -> Optional[str]:
     
     return None
 
+# Status message updates
+def retry_after_seconds(error) -> float:
+    """Seconds a RetryAfter error asks to wait; newer PTB versions may use a timedelta."""
+    delay = getattr(error, 'retry_after', 1)
+    return delay.total_seconds() if hasattr(delay, 'total_seconds') else float(delay)
+
+class StatusEditor:
+    """Paces status message edits per chat and across the whole bot.
+
+    Private chats get one edit per ``chat_interval`` seconds, groups one per
+    ``group_interval``; a 429 pauses the chat for as long as Telegram asks.
+    """
+
+    def __init__(self, edits_per_second: int, chat_interval: float, group_interval: float):
+        self.global_interval = 1.0 / max(1, edits_per_second)
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.next_global = 0.0
+        self.next_chat: Dict[Any, float] = {}
+
+        # Metrics
+        self.edits = 0
+        self.coalesced = 0
+        self.unchanged = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    def track(self, query) -> "StatusQuery":
+        """Wrap a callback query so its edit_message_text queues instead of waiting."""
+        chat_id = getattr(getattr(query, 'message', None), 'chat_id', None)
+        return StatusQuery(query, StatusMessage(self, query.edit_message_text, chat_id))
+
+    async def acquire(self, chat_id):
+        """Wait for the chat's next edit slot, then for a bot-wide one."""
+        now = time.monotonic()
+        interval = self.group_interval if isinstance(chat_id, int) and chat_id < 0 else self.chat_interval
+        slot = max(now, self.next_chat.get(chat_id, 0.0))
+        self.next_chat[chat_id] = slot + interval
+        if len(self.next_chat) > 1000:
+            self.next_chat = {key: value for key, value in self.next_chat.items() if value > now}
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+        now = time.monotonic()
+        slot = max(now, self.next_global)
+        self.next_global = slot + self.global_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def back_off(self, chat_id, delay: float):
+        self.rate_limited += 1
+        self.next_chat[chat_id] = max(self.next_chat.get(chat_id, 0.0), time.monotonic() + delay)
+
+class StatusMessage:
+    """The latest wanted text of one status message, delivered in the background.
+
+    ``set`` returns at once; texts set while an edit is waiting for its slot
+    replace each other, so only the newest one is sent. ``set_final`` waits
+    for the edit and raises if it failed, for callers that fall back to a
+    new message.
+    """
+
+    def __init__(self, editor: StatusEditor, edit: Callable[..., Awaitable], chat_id):
+        self.editor = editor
+        self.edit = edit
+        self.chat_id = chat_id
+        # (text, edit_message_text keyword arguments)
+        self.wanted: Optional[Tuple[str, Dict]] = None
+        self.shown: Optional[Tuple[str, Dict]] = None
+        self.error: Optional[Exception] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def set(self, text: str, **kwargs):
+        wanted = (text, kwargs)
+        if wanted == self.wanted:
+            self.editor.unchanged += 1
+            return
+        if self.wanted != self.shown:
+            self.editor.coalesced += 1
+        self.wanted = wanted
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._deliver())
+
+    async def set_final(self, text: str, **kwargs):
+        """Send ``text`` as soon as pacing allows and wait for it; raises if the edit failed."""
+        self.set(text, **kwargs)
+        await self.flush()
+        if self.error is not None:
+            raise self.error
+
+    async def _deliver(self):
+        while self.wanted is not None and self.wanted != self.shown:
+            await self.editor.acquire(self.chat_id)
+            wanted = self.wanted
+            if wanted == self.shown:
+                self.editor.unchanged += 1
+                break
+            text, kwargs = wanted
+            try:
+                await self.edit(text, **kwargs)
+                self.editor.edits += 1
+                self.error = None
+            except RetryAfter as e:
+                self.editor.back_off(self.chat_id, retry_after_seconds(e))
+                continue
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    self.editor.unchanged += 1
+                    self.error = None
+                else:
+                    self.editor.failed += 1
+                    self.error = e
+                    debug_write(f"Could not update status message: {e}")
+            except Exception as e:
+                self.editor.failed += 1
+                self.error = e
+                debug_write(f"Could not update status message: {e}")
+            self.shown = wanted
+
+    async def flush(self):
+        """Wait until the latest text has been sent (or given up on)."""
+        while self.task is not None and not self.task.done():
+            await self.task
+
+class StatusQuery:
+    """A callback query whose ``edit_message_text`` only queues the new text.
+
+    Pass ``final=True`` to wait for the edit and get its error, e.g. before
+    falling back to a reply.
+    """
+
+    def __init__(self, query, status: StatusMessage):
+        self._query = query
+        self.status = status
+
+    def __getattr__(self, name):
+        return getattr(self._query, name)
+
+    async def edit_message_text(self, text: str, final: bool = False, **kwargs):
+        if final:
+            await self.status.set_final(text, **kwargs)
+        else:
+            self.status.set(text, **kwargs)
+
+# Batch (playlist/album) helpers
+class BatchProgress:
+    """Aggregated progress of a multi-track download, shown in one message."""
+
+    def __init__(self, title: str, total: int, update: Callable[[str], Awaitable], min_interval: float = 3.0):
+        self.title = title
+        self.total = total
+        self.update = update
+        self.min_interval = min_interval
+        self.done = 0
+        self.cached = 0
+        self.failed = 0
+        self.failed_titles: List[str] = []
+        self.last_text = None
+        self.last_update = 0.0
+
+    def render(self, finished: bool = False) -> str:
+        finished_count = self.done + self.cached + self.failed
+        header = "✅ Finished" if finished else "⏳ Downloading"
+        text = (
+            f"{self.title}\n\n{header}: {finished_count}/{self.total} tracks\n"
+            f"📥 Downloaded: {self.done}  ♻️ Cached: {self.cached}  ❌ Failed: {self.failed}"
+        )
+        if finished and self.failed_titles:
+            text += "\n\nCould not download:\n" + "\n".join(f"• {title}" for title in self.failed_titles[:20])
+        return text
+
+    async def record(self, outcome: str, title: str = ""):
+        """Count a finished track ('done', 'cached' or 'failed') and refresh the message."""
+        if outcome == 'cached':
+            self.cached += 1
+        elif outcome == 'failed':
+            self.failed += 1
+            self.failed_titles.append(title)
+        else:
+            self.done += 1
+        await self.refresh()
+
+    async def refresh(self, force: bool = False):
+        now = time.monotonic()
+        text = self.render()
+        if text == self.last_text or (not force and now - self.last_update < self.min_interval):
+            return
+        self.last_text, self.last_update = text, now
+        try:
+            await self.update(text)
+        except Exception as e:
+            debug_write(f"Could not update batch progress: {e}")
+
+    async def finish(self):
+        try:
+            await self.update(self.render(finished=True))
+        except Exception as e:
+            debug_write(f"Could not send batch summary: {e}")
+
+async def run_batch(items: List, worker: Callable[[int, Any], Awaitable], parallelism: int) -> List:
+    """Run ``worker(index, item)`` for every item with at most ``parallelism`` running at once.
+
+    Indexes start at 1. Exceptions are returned in place of results.
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+
+    async def run_one(index: int, item):
+        async with semaphore:
+            return await worker(index, item)
+
+    return await asyncio.gather(
+        *(run_one(index, item) for index, item in enumerate(items, 1)),
+        return_exceptions=True
+    )
+
+# Status words spotdl prints while working on a song
+SPOTDL_STAGES = (
+    ("Downloaded", "✅ Downloaded"),
+    ("Embedding", "🏷 Adding metadata"),
+    ("Converting", "⚙️ Converting"),
+    ("Downloading", "⬇️ Downloading"),
+    ("Found", "🔍 Found a match"),
+    ("Searching", "🔍 Searching"),
+    ("Processing", "🔍 Looking up the track"),
+)
+
+def parse_spotdl_progress(line: str) -> Optional[str]:
+    """Turn a line of spotdl output into a short status, if it carries one."""
+    percent = re.search(r"(\d{1,3})%", line)
+    for keyword, status in SPOTDL_STAGES:
+        if keyword.lower() in line.lower():
+            return f"{status} ({percent.group(1)}%)" if percent else status
+    if percent:
+        return f"⬇️ Downloading ({percent.group(1)}%)"
+    return None
+
+# yt-dlp protocols FFmpeg can read from a single URL
+STREAMABLE_PROTOCOLS = ('http', 'https', 'm3u8', 'm3u8_native')
+
+# Target bitrates (kbps) per audio quality tier
+QUALITY_BITRATES = {
+    AudioQuality.HIGH: 320,
+    AudioQuality.MEDIUM: 192,
+    AudioQuality.LOW: 128,
+}
+
+def audio_bitrate_band(quality: str) -> Tuple[int, int]:
+    """Bitrates (kbps) a native stream may have to be copied for a tier; the tiers' bands don't overlap."""
+    target = QUALITY_BITRATES.get(quality, 192)
+    return round(target * 0.75), round(target * 1.1)
+
+def audio_format_selector(quality: str) -> str:
+    """yt-dlp format selector for a quality tier.
+
+    Prefers an AAC or MP3 stream within the tier's bitrate band, which is
+    copied as is; otherwise takes the best audio, which is transcoded to MP3
+    at the tier's bitrate (see ytdl_worker.native_audio_ext). The result
+    depends only on the source's formats, and tiers never share an output.
+    """
+    low, high = audio_bitrate_band(quality)
+    band = f"[abr>={low}][abr<={high}]"
+    return "/".join([*(f"bestaudio[ext={ext}]{band}" for ext in ytdl_worker.NATIVE_AUDIO_EXTS), "bestaudio", "best"])
+
+def audio_variant(quality: str) -> str:
+    """Cache key suffix naming the output ``audio_format_selector`` produces for a tier."""
+    low, high = audio_bitrate_band(quality)
+    return f"native{low}-{high}_mp3{QUALITY_BITRATES.get(quality, 192)}"
+
+# Share of the upload limit a predicted output may use; leaves room for container overhead and VBR
+UPLOAD_SIZE_HEADROOM = 0.9
+
+def predict_audio_size(duration: float, bitrate_kbps: float) -> int:
+    """Predicted size in bytes of ``duration`` seconds of audio at ``bitrate_kbps``."""
+    return int(duration * bitrate_kbps * 1000 / 8)
+
+def plan_audio_output(duration: Optional[float], quality: str, max_bytes: int) -> Tuple[str, int]:
+    """Choose the quality and number of parts so each upload fits in ``max_bytes``.
+
+    Returns ``(quality, 1)`` with the highest tier up to the requested one
+    whose predicted size fits. If even the lowest tier is too large, keeps
+    the requested quality and returns how many parts to split it into.
+    Without a known duration the request is returned unchanged.
+    """
+    if not duration:
+        return quality, 1
+
+    budget = max_bytes * UPLOAD_SIZE_HEADROOM
+    tiers = [AudioQuality.HIGH, AudioQuality.MEDIUM, AudioQuality.LOW]
+    start = tiers.index(quality) if quality in tiers else 1
+    for tier in tiers[start:]:
+        if predict_audio_size(duration, QUALITY_BITRATES[tier]) <= budget:
+            return tier, 1
+
+    return quality, math.ceil(predict_audio_size(duration, QUALITY_BITRATES.get(quality, 192)) / budget)
+
+# Update processing
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Handle updates concurrently while keeping each user's updates in order.
+
+    A user's update waits for that user's previous one before taking one of
+    the ``max_concurrent_updates`` slots, so a single busy user can't fill
+    every slot with queued updates. PTB takes its own semaphore before
+    ``do_process_update`` (``process_update`` is final), so that one is left
+    unbounded and the cap is applied here, after the per-user lock.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(2 ** 31 - 1)
+        self.limit = max(1, max_concurrent_updates)
+        self.slots = asyncio.Semaphore(self.limit)
+        self.locks: Dict[Any, asyncio.Lock] = {}
+        self.waiting: Dict[Any, int] = {}
+
+    @staticmethod
+    def ordering_key(update) -> Optional[Any]:
+        user = getattr(update, 'effective_user', None)
+        if user:
+            return ('user', user.id)
+        chat = getattr(update, 'effective_chat', None)
+        if chat:
+            return ('chat', chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.ordering_key(update)
+        if key is None:
+            async with self.slots:
+                await coroutine
+            return
+
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self.slots:
+                    await coroutine
+        finally:
+            self.waiting[key] -= 1
+            if not self.waiting[key]:
+                del self.waiting[key]
+                del self.locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+# Outgoing request pacing
+class SendPriority:
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+# Uploads and button answers go first, cosmetic calls last; anything not listed is NORMAL
+ENDPOINT_PRIORITIES = {
+    'sendAudio': SendPriority.HIGH,
+    'sendDocument': SendPriority.HIGH,
+    'sendVoice': SendPriority.HIGH,
+    'answerCallbackQuery': SendPriority.HIGH,
+    'sendChatAction': SendPriority.LOW,
+    'forwardMessage': SendPriority.LOW,
+    'setMessageReaction': SendPriority.LOW,
+    'deleteMessage': SendPriority.LOW,
+}
+
+class TokenBucket:
+    """Token bucket that lets callers reserve a token ahead of time."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a whole token is available."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self) -> float:
+        """Take a token, going into debt if needed, and return how long to wait for it."""
+        self._refill()
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def pause(self, seconds: float):
+        """Hand out nothing for ``seconds``; later reservations queue up behind the pause."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def is_idle(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+class FloodControlLimiter(BaseRateLimiter):
+    """Keep every Bot API call inside Telegram's flood limits.
+
+    A call first waits for its chat's buckets (``chat_per_second`` for every
+    chat, plus ``group_per_minute`` for groups and channels), then for the
+    bot-wide bucket, where waiting calls are let through by priority so
+    uploads don't queue behind reactions. A RetryAfter pauses the chat (or
+    the whole bot for chatless calls) and the call is retried.
+    """
+
+    # Never paced: long polling and bookkeeping that has no flood limit
+    UNLIMITED_ENDPOINTS = {'getUpdates', 'getMe', 'getFile', 'setWebhook', 'deleteWebhook', 'close', 'logOut'}
+
+    def __init__(self, global_per_second: int, chat_per_second: int, group_per_minute: int, max_retries: int):
+        global_per_second = max(1, global_per_second)
+        self.global_bucket = TokenBucket(global_per_second, global_per_second)
+        self.chat_per_second = max(1, chat_per_second)
+        self.group_per_minute = max(1, group_per_minute)
+        self.max_retries = max_retries
+        self.chat_buckets: Dict[Any, List[TokenBucket]] = {}
+        self.waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self.sequence = 0
+        self.dispatcher: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.requests = 0
+        self.delayed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.wait_by_priority: Dict[int, float] = {}
+        self.flood_errors = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.dispatcher
+
+    def buckets_for(self, chat_id) -> List[TokenBucket]:
+        if chat_id is None:
+            return []
+        buckets = self.chat_buckets.get(chat_id)
+        if buckets is None:
+            if len(self.chat_buckets) > 1000:
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items()
+                    if not all(bucket.is_idle() for bucket in value)
+                }
+            # Negative ids and @usernames are groups and channels
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            buckets = [TokenBucket(self.chat_per_second, 1)]
+            if is_group:
+                buckets.append(TokenBucket(self.group_per_minute / 60, self.group_per_minute))
+            self.chat_buckets[chat_id] = buckets
+        return buckets
+
+    async def acquire(self, chat_id, priority: int):
+        delay = max((bucket.reserve() for bucket in self.buckets_for(chat_id)), default=0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if not self.waiting and self.global_bucket.wait_time() == 0:
+            self.global_bucket.reserve()
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.sequence += 1
+        heapq.heappush(self.waiting, (priority, self.sequence, future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self.dispatch())
+        await future
+
+    async def dispatch(self):
+        """Release waiting calls one bot-wide token at a time, highest priority first."""
+        while self.waiting:
+            if self.waiting[0][2].done():
+                # The caller gave up waiting
+                heapq.heappop(self.waiting)
+                continue
+            delay = self.global_bucket.wait_time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self.global_bucket.reserve()
+            heapq.heappop(self.waiting)[2].set_result(None)
+
+    def record_wait(self, priority: int, wait: float):
+        self.requests += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait >= 0.01:
+            self.delayed += 1
+        self.wait_by_priority[priority] = self.wait_by_priority.get(priority, 0.0) + wait
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if endpoint in self.UNLIMITED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+
+        priority = (rate_limit_args or {}).get('priority', ENDPOINT_PRIORITIES.get(endpoint, SendPriority.NORMAL))
+        chat_id = data.get('chat_id')
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            await self.acquire(chat_id, priority)
+            self.record_wait(priority, time.monotonic() - started)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.flood_errors += 1
+                delay = retry_after_seconds(e)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Flood control on {endpoint} for chat {chat_id}, retrying in {delay:.0f}s")
+                buckets = self.buckets_for(chat_id) or [self.global_bucket]
+                for bucket in buckets:
+                    bucket.pause(delay)
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'delayed': self.delayed,
+            'waiting': len(self.waiting),
+            'avg_wait': self.total_wait / self.requests if self.requests else 0.0,
+            'max_wait': self.max_wait,
+            'wait_by_priority': dict(self.wait_by_priority),
+            'flood_errors': self.flood_errors,
+        }
+
 # Telegram Bot
 class TelegramYTDLBot:
     def __init__(self):
@@ -737,20 +2860,34 @@ class TelegramYTDLBot:
         self.bot = None
         
         # Initialize other components
-        self.queue = None  # Will be initialized later
+        self.scheduler = None  # Will be initialized later
         self.updater = None  # Will be initialized later
         self.translation = None  # Will be initialized later
         self.cobalt = None  # Will be initialized later
+        self.http = None  # Will be initialized later
+        self.send_limiter = None
         self.user_prefs = None  # Will be initialized later
-        
-        # TikTok special arguments
-        self.tiktok_args = [
-            "--extractor-args",
-            "tiktok:api_hostname=api16-normal-c-useast1a.tiktokv.com;app_info=7355728856979392262"
-        ]
+        self.media_cache = None  # Will be initialized later
+        self.file_ids = None  # Will be initialized later
+        self.ytdl_pool = None  # Will be initialized later
+        self.info_cache = None  # Will be initialized later
+        self.metadata_cache = None  # Will be initialized later
+        self.single_flight = SingleFlight()
+        self.transcoder = None  # Initialized once FFmpeg is set up
+        self.resolver_stats = ResolverStats()
+        self.pending_requests = PendingRequests(env.PENDING_REQUEST_TTL)
+        self.status_editor = StatusEditor(
+            env.STATUS_EDITS_PER_SECOND, env.STATUS_EDIT_INTERVAL, env.STATUS_GROUP_EDIT_INTERVAL
+        )
+
+        # How audio was produced, to measure the encoding work saved by remuxing
+        self.audio_path_stats = {'remux': 0, 'transcode': 0, 'remuxed_seconds': 0.0}
         
         # FFmpeg path
         self.ffmpeg_path = None
+
+        # spotdl version, "" if unavailable, None until checked
+        self.spotdl_version = None
         
         # Flag to check if bot should be running
         self.should_run = True
@@ -828,10 +2965,22 @@ class TelegramYTDLBot:
             # Create a completely new application builder with minimal configuration
             builder = ApplicationBuilder()
             builder.token(clean_token)
-
-            # DO NOT set base_url - let it use the default
-            # This avoids URL parsing issues that were causing the port error
-            debug_write("Using default Telegram API configuration")
+            builder.concurrent_updates(PerUserUpdateProcessor(env.UPDATE_CONCURRENCY))
+            self.send_limiter = FloodControlLimiter(
+                env.SEND_GLOBAL_PER_SECOND, env.SEND_CHAT_PER_SECOND, env.SEND_GROUP_PER_MINUTE, env.SEND_RETRIES
+            )
+            builder.rate_limiter(self.send_limiter)
+
+            if env.LOCAL_API_ROOT:
+                # Files are passed to the local server by path instead of being uploaded
+                builder.base_url(f"{env.LOCAL_API_ROOT}/bot")
+                builder.base_file_url(f"{env.LOCAL_API_ROOT}/file/bot")
+                builder.local_mode(True)
+                debug_write(f"Using local Bot API server at {env.LOCAL_API_ROOT}")
+            else:
+                # DO NOT set base_url - let it use the default
+                # This avoids URL parsing issues that were causing the port error
+                debug_write("Using default Telegram API configuration")
 
             # Build the application
             self.application = builder.build()
@@ -847,11 +2996,30 @@ class TelegramYTDLBot:
             debug_write("Bot instance retrieved")
             
             # Initialize other components (using classes defined in this file)
-            self.queue = Queue()
+            self.scheduler = DownloadScheduler(env.DOWNLOAD_WORKERS, env.DOWNLOAD_WORKERS_PER_USER)
             self.updater = Updater(env.YTDL_AUTOUPDATE)
-            self.translation = TranslationService(env.OPENAI_API_KEY, env.TRANSLATIONS_FILE)
-            self.cobalt = CobaltAPI(env.COBALT_INSTANCE_URL)
-            self.user_prefs = UserPreferences(env.USER_PREFS_FILE)
+            self.translation = TranslationService(
+                env.OPENAI_API_KEY,
+                env.TRANSLATIONS_DB,
+                legacy_file=env.TRANSLATIONS_FILE,
+                base_url=env.OPENAI_BASE_URL
+            )
+            self.http = HttpClient(env.HTTP_MAX_CONNECTIONS, env.HTTP_MAX_PER_HOST, env.HTTP_RETRIES)
+            self.cobalt = CobaltAPI(env.COBALT_INSTANCES, self.http, health_interval=env.COBALT_HEALTH_INTERVAL)
+            self.user_prefs = UserPreferences(env.USER_PREFS_DB, legacy_file=env.USER_PREFS_FILE)
+            if env.MEDIA_CACHE_ENABLED:
+                self.media_cache = MediaCache(
+                    env.MEDIA_CACHE_DIR,
+                    max_bytes=env.MEDIA_CACHE_MAX_MB * 1024 * 1024,
+                    ttl_seconds=env.MEDIA_CACHE_TTL_HOURS * 3600
+                )
+                logger.info(f"Media cache enabled at {env.MEDIA_CACHE_DIR} ({len(self.media_cache.entries)} entries)")
+            self.file_ids = FileIdIndex(env.FILE_ID_INDEX_FILE)
+            logger.info(f"Loaded {len(self.file_ids.records)} cached Telegram file_ids")
+            self.ytdl_pool = YtdlWorkerPool(env.YTDL_WORKERS, env.STORAGE_DIR / "temp")
+            self.ytdl_pool.start()
+            self.info_cache = InfoCache(env.INFO_CACHE_SIZE, env.INFO_CACHE_TTL)
+            self.metadata_cache = MetadataCache(env.METADATA_CACHE_FILE)
             
             # Set up handlers
             self.setup_handlers()
@@ -859,6 +3027,13 @@ class TelegramYTDLBot:
             
             # Setup FFmpeg
             await self.setup_ffmpeg()
+            if self.ffmpeg_path:
+                self.transcoder = StreamingTranscoder(self.get_ffmpeg_binary())
+
+            # Cobalt is only used once an instance answered
+            if env.COBALT_INSTANCES:
+                await self.cobalt.check_instance()
+                self.cobalt.start_health_checks()
 
             # Verify spotdl configuration if FFmpeg is available
             if self.ffmpeg_path:
@@ -933,6 +3108,16 @@ class TelegramYTDLBot:
             self.ffmpeg_path = None
             return None
 
+    def get_ffmpeg_binary(self) -> Optional[str]:
+        """Return the FFmpeg executable to invoke directly, if FFmpeg is available."""
+        if self.ffmpeg_path == "system":
+            return "ffmpeg"
+        elif self.ffmpeg_path:
+            import platform
+            name = "ffmpeg.exe" if platform.system().lower() == "windows" else "ffmpeg"
+            return str(Path(self.ffmpeg_path) / name)
+        return None
+
     async def configure_spotdl_ffmpeg(self):
         """Configure spotdl to use the available FFmpeg installation."""
         try:
@@ -960,27 +3145,36 @@ class TelegramYTDLBot:
         except Exception as e:
             logger.error(f"Error configuring spotdl FFmpeg: {e}")
 
+    async def get_spotdl_version(self) -> Optional[str]:
+        """Return the installed spotdl version, checking only once per run."""
+        if self.spotdl_version is not None:
+            return self.spotdl_version or None
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "spotdl", "--version",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=10)
+            self.spotdl_version = stdout.decode(errors='replace').strip() if process.returncode == 0 else ""
+        except Exception as e:
+            logger.error(f"spotdl is not available: {e}")
+            self.spotdl_version = ""
+
+        return self.spotdl_version or None
+
     async def verify_spotdl_setup(self):
         """Verify that spotdl is properly configured and can find FFmpeg."""
         try:
             logger.info("Verifying spotdl setup...")
 
-            # Check if spotdl is installed
-            try:
-                version_result = subprocess.run(
-                    ["spotdl", "--version"],
-                    capture_output=True,
-                    text=True,
-                    timeout=10
-                )
-                if version_result.returncode == 0:
-                    version_info = version_result.stdout.strip()
-                    logger.info(f"Using spotdl version: {version_info}")
-                else:
-                    logger.error("spotdl is not properly installed")
-                    return False
-            except Exception as e:
-                logger.error(f"spotdl is not available: {e}")
+            # Check if spotdl is installed (cached for every later download)
+            version_info = await self.get_spotdl_version()
+            if version_info:
+                logger.info(f"Using spotdl version: {version_info}")
+            else:
+                logger.error("spotdl is not properly installed")
                 return False
 
             # For spotdl 4.x, we'll test FFmpeg by trying a simple operation
@@ -1070,7 +3264,8 @@ class TelegramYTDLBot:
             debug_write(f"Traceback: {traceback.format_exc()}")
             raise
         finally:
-            # Ensure proper cleanup
+            # Stop taking updates and let handlers and downloads finish before
+            # closing anything they use
             if hasattr(self, 'application') and self.application:
                 debug_write("Shutting down bot...")
                 try:
@@ -1085,14 +3280,41 @@ class TelegramYTDLBot:
                     debug_write("Application stopped")
                 except Exception as e:
                     debug_write(f"Error stopping application: {e}")
-                
+
+            if self.scheduler:
+                await self.scheduler.shutdown()
+                debug_write("Download scheduler drained")
+
+            if hasattr(self, 'application') and self.application:
                 try:
                     await self.application.shutdown()
                     debug_write("Application shutdown complete")
                 except Exception as e:
                     debug_write(f"Error shutting down application: {e}")
-                
-                debug_write("Bot shutdown complete")
+
+            # Persist cache access order
+            if self.media_cache:
+                self.media_cache.save_index()
+
+            if self.ytdl_pool:
+                self.ytdl_pool.shutdown()
+
+            if self.metadata_cache:
+                self.metadata_cache.close()
+
+            if self.user_prefs:
+                await self.user_prefs.close()
+
+            if self.translation:
+                await self.translation.close()
+
+            if self.cobalt:
+                await self.cobalt.close()
+
+            if self.http:
+                await self.http.close()
+
+            debug_write("Bot shutdown complete")
 
     @classmethod
     async def create_and_run(cls):
@@ -1175,6 +3397,133 @@ Send me a link and I'll extract the audio for you!
 Just send me a link to get started! 🎧"""
         await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
 
+    async def handle_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the /stats command (admin only)."""
+        if not env.ADMIN_ID or update.effective_user.id != env.ADMIN_ID:
+            return
+
+        await update.message.reply_text("\n".join(self.collect_stats()))
+
+    def collect_stats(self) -> List[str]:
+        """Collect runtime metrics as human-readable lines."""
+        lines = ["📊 Bot statistics"]
+
+        if self.scheduler:
+            stats = self.scheduler.stats()
+            lines.append(
+                f"\n⏳ Downloads: {stats['running']} running, {stats['queued']} queued "
+                f"(limit {self.scheduler.max_workers}, {self.scheduler.max_per_user} per user)\n"
+                f"Completed: {stats['completed']}, failed: {stats['failed']}\n"
+                f"Wait: avg {stats['avg_wait']:.1f}s, max {stats['max_wait']:.1f}s"
+            )
+
+        lines.append(
+            f"\n🔗 Shared downloads: {self.single_flight.coalesced} requests joined "
+            f"{self.single_flight.started} downloads ({len(self.single_flight.calls)} in flight)"
+        )
+
+        if self.media_cache:
+            lines.append(
+                f"\n💾 Media cache: {len(self.media_cache.entries)} files, "
+                f"{format_file_size(self.media_cache.total_bytes)}\n"
+                f"Hits: {self.media_cache.hits}, misses: {self.media_cache.misses}"
+            )
+
+        if self.http:
+            stats = self.http.stats()
+            lines.append(
+                f"\n🌍 HTTP: {stats['requests']} requests over {stats['connections']} connections "
+                f"({stats['reused']} reused)\n"
+                f"Retried: {stats['retried']}, failed: {stats['failed']}"
+            )
+
+        if self.translation and self.translation.requests:
+            lines.append(
+                f"\n🌐 Translations: {self.translation.requests} requests, "
+                f"{self.translation.cache_hits} cached, {self.translation.api_calls} API calls"
+            )
+
+        if self.user_prefs:
+            lines.append(
+                f"\n⚙️ Preferences: {len(self.user_prefs.preferences)} users, "
+                f"{self.user_prefs.writes} changes in {self.user_prefs.flushes} writes"
+            )
+
+        if self.file_ids:
+            lines.append(
+                f"\n📎 File IDs: {len(self.file_ids.records)} stored\n"
+                f"Hits: {self.file_ids.hits}, misses: {self.file_ids.misses}"
+            )
+
+        if self.metadata_cache:
+            cache = self.metadata_cache
+            lines.append(
+                f"\n🏷 Metadata cache: {cache.hit_rate():.0%} hit rate\n"
+                f"Memory: {cache.memory_hits}, disk: {cache.disk_hits}, "
+                f"negative: {cache.negative_hits}, misses: {cache.misses}"
+            )
+
+        if self.info_cache:
+            lines.append(
+                f"\n🗂 Info cache: {len(self.info_cache.entries)} entries\n"
+                f"Hits: {self.info_cache.hits}, misses: {self.info_cache.misses}"
+            )
+
+        lines.append(
+            f"\n🔘 Pending requests: {len(self.pending_requests.entries)} waiting, "
+            f"{self.pending_requests.expired} expired"
+        )
+
+        if self.send_limiter:
+            stats = self.send_limiter.stats()
+            waits = ", ".join(
+                f"{name.lower()} {stats['wait_by_priority'].get(value, 0.0):.0f}s"
+                for name, value in vars(SendPriority).items() if not name.startswith('_')
+            )
+            lines.append(
+                f"\n🚦 Telegram requests: {stats['requests']} sent, {stats['delayed']} delayed, "
+                f"{stats['waiting']} waiting\n"
+                f"Wait: avg {stats['avg_wait']:.2f}s, max {stats['max_wait']:.1f}s ({waits})\n"
+                f"Flood errors: {stats['flood_errors']}"
+            )
+
+        editor = self.status_editor
+        lines.append(
+            f"\n✏️ Status edits: {editor.edits} sent, {editor.coalesced} coalesced, "
+            f"{editor.unchanged} unchanged\n"
+            f"Rate limited: {editor.rate_limited}, failed: {editor.failed}"
+        )
+
+        paths = self.audio_path_stats
+        lines.append(
+            f"\n🎚 Audio paths: {paths['remux']} remuxed, {paths['transcode']} transcoded "
+            f"({paths['remuxed_seconds'] / 60:.0f} min of audio not re-encoded)"
+        )
+
+        if self.cobalt and self.cobalt.instances:
+            lines.append("\n🛰 Cobalt instances:\n" + "\n".join(self.cobalt.stats()))
+
+        resolver_lines = self.resolver_stats.summary()
+        if resolver_lines:
+            lines.append("\n🧭 Resolvers:\n" + "\n".join(resolver_lines))
+
+        if self.transcoder:
+            transcoder = self.transcoder
+            average = transcoder.total_time / transcoder.streamed if transcoder.streamed else 0.0
+            lines.append(
+                f"\n🌊 Streaming transcodes: {transcoder.streamed} done, {transcoder.failed} failed, "
+                f"avg {average:.1f}s"
+            )
+
+        if self.ytdl_pool:
+            stats = self.ytdl_pool.stats()
+            lines.append(
+                f"\n⚙️ yt-dlp workers: {stats['workers']}\n"
+                f"Jobs: {stats['jobs']}, cancelled: {stats['cancelled']}, crashes: {stats['crashes']}, killed: {stats['killed']}"
+            )
+
+        return lines
+
     async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages without URLs."""
         debug_write(f"Received text message from user {update.effective_user.id}")
@@ -1201,9 +3550,10 @@ Just send me a link to get started! 🎧"""
             return
 
         # Validate URL and detect platform
-        platform = detect_platform(url)
+        platform_info = route_url(url)
+        platform = platform_info.name
 
-        if is_limited_support_url(url):
+        if platform_info.support == 'limited':
             # Handle platforms with limited support
             if platform == 'Instagram':
                 await update.message.reply_text(
@@ -1219,7 +3569,7 @@ Just send me a link to get started! 🎧"""
                 )
 
             return
-        elif not is_supported_url(url):
+        elif platform_info.support != 'full':
             await update.message.reply_text(
                 f"❌ Sorry, {platform} is not supported.\n\n"
                 f"✅ *Supported platforms:*\n"
@@ -1231,14 +3581,20 @@ Just send me a link to get started! 🎧"""
             )
             return
 
+        # Identify the media so URL variants share caches
+        media_key = canonical_media_key(url)
+        debug_write(f"Canonical media key for {url}: {media_key}")
+
         # Start audio download process
-        await self.start_audio_download(update, url)
+        await self.start_audio_download(update, url, platform_info, media_key)
 
-    async def start_audio_download(self, update: Update, url: str):
+    async def start_audio_download(self, update: Update, url: str, platform_info: Optional[PlatformInfo] = None,
+                                   media_key: Optional[str] = None):
         """Start the audio download process."""
         user_id = update.effective_user.id
         username = update.effective_user.username or update.effective_user.first_name or "Unknown"
-        platform = detect_platform(url)
+        platform_info = platform_info or route_url(url)
+        platform = platform_info.name
 
         # Log the download request with platform info
         user_logger.info(f"DOWNLOAD REQUEST | User: {username} ({user_id}) | Platform: {platform} | URL: {url}")
@@ -1248,9 +3604,18 @@ Just send me a link to get started! 🎧"""
         processing_msg = await update.message.reply_text(f"🎵 Processing {platform} link...")
 
         try:
-            # Extract audio info
+            # Extract audio info; Cobalt links are resolved at download time
             debug_write(f"Extracting audio info for {platform}")
-            info = await self.extract_audio_info(url)
+            if self.cobalt and self.transcoder and self.cobalt.matches_url(url):
+                info = {
+                    'title': f"{platform} audio",
+                    'duration': 0,
+                    'uploader': 'Unknown',
+                    'platform': platform,
+                    'url': url
+                }
+            else:
+                info = await self.extract_audio_info(url, platform_info, media_key)
             debug_write(f"Audio info extracted: {info}")
 
             if not info:
@@ -1276,11 +3641,20 @@ Just send me a link to get started! 🎧"""
                     def __init__(self, message):
                         self.message = message
 
-                    async def edit_message_text(self, text):
-                        await self.message.edit_text(text)
+                    async def edit_message_text(self, text, **kwargs):
+                        await self.message.edit_text(text, **kwargs)
 
-                mock_query = MockQuery(processing_msg)
-                await self.download_spotify_audio(mock_query, url, "high", username, user_id)
+                mock_query = self.status_editor.track(MockQuery(processing_msg))
+                if info.get('is_collection'):
+                    download = lambda: self.download_spotify_collection(mock_query, url, "high", username, user_id)
+                else:
+                    download = lambda: self.download_spotify_audio(mock_query, url, "high", username, user_id)
+                await self.scheduler.submit(
+                    user_id,
+                    self.with_status_flush(mock_query, download),
+                    on_queued=lambda position: mock_query.edit_message_text(f"⏳ You are #{position} in line. Your download will start shortly..."),
+                    batch=bool(info.get('is_collection'))
+                )
             else:
                 # Show audio quality options for other platforms
                 debug_write(f"Showing quality options for {platform}")
@@ -1308,68 +3682,61 @@ Just send me a link to get started! 🎧"""
 
     def get_platform_error_message(self, platform: str) -> str:
         """Get platform-specific error message and tips."""
-        messages = {
-            'Instagram': "❌ Instagram requires login/cookies. This platform has limited support.\n💡 Try using YouTube or TikTok instead.",
-            'Spotify': "💡 Tips for Spotify:\n• Make sure the track/playlist is public\n• Bot searches for tracks on YouTube\n• Some region-locked content may not be available",
-            'YouTube': "💡 Tips for YouTube:\n• Check if the video is public\n• Age-restricted content may not work\n• Live streams are not supported",
-            'TikTok': "💡 Tips for TikTok:\n• Make sure the video is public\n• Private accounts may not work",
-            'Twitter/X': "💡 Tips for Twitter/X:\n• Make sure the tweet is public\n• Protected accounts may not work",
-            'SoundCloud': "💡 Tips for SoundCloud:\n• Make sure the track is public\n• Private tracks may not work",
-            'Vimeo': "💡 Tips for Vimeo:\n• Check if the video is public\n• Password-protected videos won't work",
-            'Facebook': "💡 Tips for Facebook:\n• Make sure the video is public\n• Private posts may not work"
-        }
-        return messages.get(platform, "💡 Please check if the link is valid and publicly accessible.")
+        return PLATFORMS.get(platform, UNKNOWN_PLATFORM).error_tips
 
-    async def extract_audio_info(self, url: str):
+    async def extract_audio_info(self, url: str, platform_info: Optional[PlatformInfo] = None,
+                                 media_key: Optional[str] = None):
         """Extract basic info from the URL with platform-specific handling."""
+        metadata_key = media_key or canonical_media_key(url) or normalize_url(url)
+        platform_info = platform_info or route_url(url)
         try:
-            import yt_dlp
-            platform = detect_platform(url)
+            platform = platform_info.name
+
+            # Serve display info from the metadata cache when possible
+            if platform != 'Spotify' and self.metadata_cache:
+                cached = self.metadata_cache.get(metadata_key)
+                if cached is not MetadataCache.MISSING:
+                    debug_write(f"Metadata cache {'hit' if cached else 'negative hit'} for {url}")
+                    return dict(cached, url=url) if cached else None
+
+            # Playlists and channels only need a flat listing
+            if is_youtube_collection_url(url):
+                result = await self.extract_youtube_collection_info(url)
+                if self.metadata_cache:
+                    self.metadata_cache.put(metadata_key, result, platform)
+                return result
 
             # Platform-specific options
             ydl_opts = {
                 'quiet': True,
                 'no_warnings': True,
                 'extract_flat': False,
+                'noplaylist': True,
             }
 
             # Add platform-specific configurations
-            if platform == 'Instagram':
-                ydl_opts.update({
-                    'extractor_args': {
-                        'instagram': {
-                            'include_stories': True,
-                        }
-                    }
-                })
-            elif platform == 'Spotify':
+            if platform == 'Spotify':
                 # For Spotify, we'll extract metadata using our custom function
                 return await self.extract_spotify_info_for_display(url)
-            elif platform == 'TikTok':
-                ydl_opts.update({
-                    'extractor_args': {
-                        'tiktok': {
-                            'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
-                        }
-                    }
-                })
+            if platform_info.extractor_args:
+                ydl_opts['extractor_args'] = platform_info.ydl_extractor_args()
 
             # Add cookie file if available
             if env.COOKIE_FILE.exists():
                 ydl_opts['cookiefile'] = str(env.COOKIE_FILE)
 
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # Add timeout for info extraction
-                    info = await asyncio.wait_for(
-                        asyncio.get_event_loop().run_in_executor(
-                            None, lambda: ydl.extract_info(url, download=False)
-                        ),
-                        timeout=60  # 1 minute timeout for info extraction
-                    )
+                info = await self.ytdl_pool.run(
+                    {'url': url, 'ydl_opts': ydl_opts, 'download': False},
+                    timeout=60  # 1 minute timeout for info extraction
+                )
             except asyncio.TimeoutError:
                 raise Exception("Info extraction timed out after 1 minute")
 
+            # Keep the full info so the download can skip a second extraction
+            if info.get('_type', 'video') == 'video':
+                self.info_cache.put(url, info)
+
             # Extract platform-specific information
             title = info.get('title', 'Unknown Title')
             uploader = info.get('uploader', info.get('channel', info.get('artist', 'Unknown')))
@@ -1380,18 +3747,57 @@ Just send me a link to get started! 🎧"""
                 title = info.get('track', info.get('title', title))
                 uploader = info.get('artist', info.get('uploader', uploader))
 
-            return {
+            result = {
                 'title': title,
                 'duration': duration,
                 'uploader': uploader,
                 'platform': platform,
                 'url': url
             }
+            if self.metadata_cache:
+                self.metadata_cache.put(metadata_key, result, platform)
+            return result
 
         except Exception as e:
-            debug_write(f"Error extracting info from {detect_platform(url)}: {e}")
+            debug_write(f"Error extracting info from {platform_info.name}: {e}")
+            if self.metadata_cache and is_permanent_extraction_error(e):
+                self.metadata_cache.put_failure(metadata_key)
             return None
 
+    async def list_youtube_collection(self, url: str) -> Dict:
+        """Flat-extract a YouTube playlist or channel, up to BATCH_MAX_TRACKS entries."""
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'playlistend': env.BATCH_MAX_TRACKS,
+        }
+        if env.COOKIE_FILE.exists():
+            ydl_opts['cookiefile'] = str(env.COOKIE_FILE)
+
+        try:
+            return await self.ytdl_pool.run(
+                {'url': youtube_collection_listing_url(url), 'ydl_opts': ydl_opts, 'download': False},
+                timeout=60
+            )
+        except asyncio.TimeoutError:
+            raise Exception("Playlist listing timed out after 1 minute")
+
+    async def extract_youtube_collection_info(self, url: str) -> Dict:
+        """Build the quality-preview info for a YouTube playlist or channel."""
+        listing = await self.list_youtube_collection(url)
+        entries = [entry for entry in listing.get('entries') or [] if entry]
+
+        return {
+            'title': listing.get('title', 'Unknown Playlist'),
+            'duration': sum(entry.get('duration') or 0 for entry in entries),
+            'uploader': listing.get('uploader', listing.get('channel', 'Unknown')),
+            'platform': 'YouTube',
+            'url': url,
+            'is_collection': True,
+            'entry_count': len(entries)
+        }
+
     async def extract_spotify_info_for_display(self, url: str):
         """Extract Spotify info for display purposes only."""
         try:
@@ -1408,22 +3814,39 @@ Just send me a link to get started! 🎧"""
             if not track_id:
                 debug_write("No track ID found, checking URL format")
                 # Check if it's a valid Spotify URL but not a track
-                if '/playlist/' in url or '/album/' in url:
-                    raise Exception("Playlists and albums are not supported yet. Please use individual track links.")
+                collection_kind = self.extract_spotify_collection_kind(url)
+                if collection_kind:
+                    return {
+                        'title': f"Spotify {collection_kind}",
+                        'duration': 0,
+                        'uploader': 'Spotify',
+                        'platform': 'Spotify',
+                        'url': url,
+                        'is_collection': True
+                    }
                 elif '/artist/' in url:
                     raise Exception("Artist pages are not supported. Please use individual track links.")
                 else:
                     raise Exception("Could not extract track ID from Spotify URL. Please check the link format.")
 
-            # Try to get metadata for display
-            debug_write(f"Getting metadata for track ID: {track_id}")
-            try:
-                metadata = await self.get_spotify_track_metadata(track_id)
-                debug_write(f"Metadata result: {metadata}")
-            except Exception as metadata_error:
-                debug_write(f"Metadata extraction failed: {metadata_error}")
-                # Continue with default info instead of failing
-                metadata = None
+            # Try to get metadata for display, from the cache first
+            metadata_key = f"spotify:track:{track_id}"
+            metadata = self.metadata_cache.get(metadata_key) if self.metadata_cache else MetadataCache.MISSING
+            if metadata is MetadataCache.MISSING:
+                debug_write(f"Getting metadata for track ID: {track_id}")
+                try:
+                    metadata = await self.get_spotify_track_metadata(track_id)
+                    debug_write(f"Metadata result: {metadata}")
+                except Exception as metadata_error:
+                    debug_write(f"Metadata extraction failed: {metadata_error}")
+                    # Continue with default info instead of failing
+                    metadata = None
+
+                # A missing result can't be told apart from a network error, so it isn't cached
+                if self.metadata_cache and metadata:
+                    self.metadata_cache.put(metadata_key, metadata, 'Spotify')
+            else:
+                debug_write(f"Metadata cache {'hit' if metadata else 'negative hit'} for track ID: {track_id}")
 
             if metadata:
                 result = {
@@ -1462,25 +3885,23 @@ Just send me a link to get started! 🎧"""
         else:
             duration_str = "Unknown"
 
-        # Platform emoji mapping
-        platform_emojis = {
-            'YouTube': '🎥',
-            'Instagram': '📸',
-            'Spotify': '🎵',
-            'TikTok': '🎬',
-            'Twitter/X': '🐦',
-            'SoundCloud': '🎧',
-            'Facebook': '📘'
-        }
-
-        platform_emoji = platform_emojis.get(platform, '🎵')
+        platform_emoji = PLATFORMS.get(platform, UNKNOWN_PLATFORM).emoji
 
         text = f"{platform_emoji} *{title}*\n\n👤 {uploader}\n⏱ Duration: {duration_str}\n🌐 Platform: {platform}\n\nChoose audio quality:"
+        if info.get('is_collection'):
+            text = text.replace("\n\nChoose", f"\n📃 Tracks: {info.get('entry_count', 0)}\n\nChoose")
+
+        # Buttons carry a short token; the request itself waits in the pending table
+        token = self.pending_requests.add({
+            'url': url,
+            'platform_info': route_url(url),
+            'info': info,
+        })
 
         keyboard = [
-            [InlineKeyboardButton("🔊 High Quality (320kbps)", callback_data=f"{CallbackPrefix.AUDIO_QUALITY}high:{url}")],
-            [InlineKeyboardButton("🎵 Medium Quality (192kbps)", callback_data=f"{CallbackPrefix.AUDIO_QUALITY}medium:{url}")],
-            [InlineKeyboardButton("📻 Low Quality (128kbps)", callback_data=f"{CallbackPrefix.AUDIO_QUALITY}low:{url}")],
+            [InlineKeyboardButton("🔊 High Quality (320kbps)", callback_data=f"{CallbackPrefix.AUDIO_QUALITY}high:{token}")],
+            [InlineKeyboardButton("🎵 Medium Quality (192kbps)", callback_data=f"{CallbackPrefix.AUDIO_QUALITY}medium:{token}")],
+            [InlineKeyboardButton("📻 Low Quality (128kbps)", callback_data=f"{CallbackPrefix.AUDIO_QUALITY}low:{token}")],
             [InlineKeyboardButton("❌ Cancel", callback_data=CallbackPrefix.CANCEL)]
         ]
 
@@ -1491,6 +3912,8 @@ Just send me a link to get started! 🎧"""
         """Handle callback queries from inline buttons."""
         query = update.callback_query
         await query.answer()
+        # Status edits below are queued and paced instead of awaited one by one
+        query = self.status_editor.track(query)
 
         data = query.data
         user_id = update.effective_user.id
@@ -1501,24 +3924,43 @@ Just send me a link to get started! 🎧"""
 
         # Process different callback types
         if data.startswith(CallbackPrefix.AUDIO_QUALITY):
-            # Parse quality and URL from callback data
+            # Parse quality and request token from callback data
             parts = data[len(CallbackPrefix.AUDIO_QUALITY):].split(":", 1)
             if len(parts) != 2:
                 await query.edit_message_text("❌ Invalid selection. Please try again.")
                 return
 
-            quality, url = parts
+            quality, token = parts
+            if "://" in token:
+                # Buttons sent before tokens were introduced carry the URL itself
+                url, platform_info, preview = token, route_url(token), None
+            else:
+                pending = self.pending_requests.get(token)
+                if not pending:
+                    await query.edit_message_text("⌛ This request has expired. Please send the link again.")
+                    return
+                url, platform_info, preview = pending['url'], pending['platform_info'], pending['info']
 
             # Save quality preference for user
             await self.user_prefs.set_user_preference(user_id, "preferred_audio_quality", quality)
 
             # Log user preference and start download
-            platform = detect_platform(url)
+            platform = platform_info.name
             user_logger.info(f"AUDIO QUALITY SELECTED | User: {username} ({user_id}) | Platform: {platform} | Quality: {quality} | URL: {url}")
 
-            # Start audio download
+            # Queue the audio download
             await query.answer(f"🎵 Starting {platform} audio download...")
-            await self.download_audio(query, url, quality, username, user_id)
+            batch = is_youtube_collection_url(url)
+            if batch:
+                download = lambda: self.download_youtube_collection(query, url, quality, username, user_id)
+            else:
+                download = lambda: self.download_audio(query, url, quality, username, user_id, platform_info, preview)
+            await self.scheduler.submit(
+                user_id,
+                self.with_status_flush(query, download),
+                on_queued=lambda position: query.edit_message_text(f"⏳ You are #{position} in line. Your download will start shortly..."),
+                batch=batch
+            )
 
         elif data == CallbackPrefix.CANCEL:
             # Cancel download
@@ -1527,10 +3969,206 @@ Just send me a link to get started! 🎧"""
         else:
             await query.answer("Unknown option")
 
-    async def download_audio(self, query, url: str, quality: str, username: str, user_id: int):
-        """Download audio from the given URL with platform-specific handling."""
+    def with_status_flush(self, query: StatusQuery, download: Callable[[], Awaitable]) -> Callable[[], Awaitable]:
+        """Make a download job that only finishes once its last status edit is sent."""
+        async def run():
+            try:
+                return await download()
+            finally:
+                await query.status.flush()
+        return run
+
+    def resolve_media_key(self, url: str) -> Optional[str]:
+        """Return the "<extractor>:<media id>" key of a URL, from earlier downloads or the URL itself."""
+        if self.media_cache:
+            base_key = self.media_cache.resolve_alias(url)
+            if base_key:
+                return base_key
+        if self.file_ids:
+            base_key = self.file_ids.resolve_alias(url)
+            if base_key:
+                return base_key
+        return canonical_media_key(url)
+
+    async def send_cached_file_id(self, query, key: str) -> Optional[Dict]:
+        """Re-send an already uploaded audio by its Telegram file_id.
+
+        Returns the index record on success, or None if nothing is indexed
+        or the send failed. The record is only dropped when Telegram rejects
+        the file_id; other errors (timeouts, network) leave it for next time.
+        """
+        if not self.file_ids:
+            return None
+
+        record = self.file_ids.get(key)
+        if not record:
+            return None
+
+        try:
+            await query.message.reply_audio(audio=record['file_id'], caption=record.get('caption'))
+            return record
+        except BadRequest as e:
+            logger.warning(f"Cached file_id for {key} was rejected, falling back to upload: {e}")
+            self.file_ids.remove(key)
+            return None
+        except Exception as e:
+            logger.warning(f"Could not send cached file_id for {key}, falling back to upload: {e}")
+            return None
+
+    def remember_file_id(self, key: str, message, title: str, caption: str):
+        """Store the file_id of an uploaded audio message for later reuse."""
+        if not self.file_ids or not message:
+            return
+
+        media = message.audio or message.document
+        if media:
+            self.file_ids.set(key, media.file_id, title, caption)
+
+    async def send_audio_file(self, query, path: Path, **kwargs):
+        """Send an audio file, by path to a local Bot API server or as an upload otherwise."""
+        size = path.stat().st_size
+        if size > env.MAX_UPLOAD_BYTES:
+            raise Exception(
+                f"File is too large for Telegram ({format_file_size(size)}, "
+                f"limit {format_file_size(env.MAX_UPLOAD_BYTES)})"
+            )
+
+        if env.LOCAL_API_ROOT:
+            # local_mode turns the path into a file:// reference, so nothing is copied
+            return await query.message.reply_audio(audio=path.resolve(), **kwargs)
+
+        with open(path, 'rb') as audio_file:
+            return await query.message.reply_audio(audio=audio_file, **kwargs)
+
+    async def split_audio(self, path: Path, duration: Optional[float]) -> List[Path]:
+        """Cut an audio file into parts that each fit the upload limit, in one FFmpeg pass."""
+        ffmpeg_binary = self.get_ffmpeg_binary()
+        if not ffmpeg_binary:
+            raise Exception("File is too large for Telegram and FFmpeg is not available to split it")
+
+        size = path.stat().st_size
+        parts = math.ceil(size / (env.MAX_UPLOAD_BYTES * UPLOAD_SIZE_HEADROOM))
+        if not duration:
+            # Estimate from the size, assuming a constant bitrate
+            duration = size * 8 / (QUALITY_BITRATES[AudioQuality.MEDIUM] * 1000)
+        segment_time = math.ceil(duration / parts)
+
+        part_dir = path.parent / f"{path.stem}_parts_{uuid.uuid4().hex[:8]}"
+        part_dir.mkdir()
+        process = await asyncio.create_subprocess_exec(
+            ffmpeg_binary, "-hide_banner", "-loglevel", "error", "-i", str(path),
+            "-map", "0:a", "-c", "copy", "-f", "segment", "-segment_time", str(segment_time),
+            "-reset_timestamps", "1", str(part_dir / f"part_%03d{path.suffix}"),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=300)
+        except asyncio.TimeoutError:
+            process.kill()
+            shutil.rmtree(part_dir, ignore_errors=True)
+            raise Exception("Splitting the audio timed out")
+        part_files = sorted(part_dir.glob(f"part_*{path.suffix}"))
+        if process.returncode != 0 or not part_files:
+            shutil.rmtree(part_dir, ignore_errors=True)
+            raise Exception(f"Could not split audio: {stderr.decode(errors='replace')[-200:]}")
+        return part_files
+
+    async def send_audio_parts(self, query, path: Path, title: str, performer: str,
+                               duration: Optional[float], quality_label: str,
+                               show_status: bool = True) -> List[Tuple[str, str]]:
+        """Split an oversized audio file and upload the numbered parts concurrently.
+
+        Returns each part's ``(file_id, caption)`` in order.
+        """
+        if show_status:
+            await query.edit_message_text("✂️ File is larger than Telegram allows, splitting into parts...")
+        part_files = await self.split_audio(path, duration)
+        total = len(part_files)
+        try:
+            if show_status:
+                await query.edit_message_text(f"📤 Uploading {total} parts...")
+
+            async def upload_part(index: int, part_file: Path):
+                part_title = f"{title} (Part {index}/{total})"
+                caption = f"🎵 {part_title}\n\n📊 Quality: {quality_label}\n📁 Size: {part_file.stat().st_size / (1024 * 1024):.1f}MB"
+                sent_message = await self.send_audio_file(
+                    query,
+                    part_file,
+                    title=part_title,
+                    performer=performer,
+                    caption=caption
+                )
+                media = sent_message.audio or sent_message.document if sent_message else None
+                return media.file_id if media else None, caption
+
+            results = await run_batch(part_files, upload_part, env.BATCH_PARALLELISM)
+            failed = [index for index, sent in enumerate(results, 1) if isinstance(sent, Exception)]
+            if failed:
+                raise Exception(f"Could not upload part(s) {', '.join(map(str, failed))} of {total}")
+            return results
+        finally:
+            shutil.rmtree(part_files[0].parent, ignore_errors=True)
+
+    def build_download_opts(self, platform_info: PlatformInfo, quality: str, temp_filepath: Path) -> Dict:
+        """Build yt-dlp options that download audio for a platform to ``<temp_filepath>.<ext>``."""
+        # Set quality-specific options
+        quality_map = {
+            "high": "320",
+            "medium": "192",
+            "low": "128"
+        }
+
+        # Prepare download options for audio only
+        ydl_opts = {
+            'format': audio_format_selector(quality),
+            'outtmpl': f"{str(temp_filepath)}.%(ext)s",
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'mp3',
+                'preferredquality': quality_map.get(quality, '192'),
+            }],
+            'quiet': True,
+            'no_warnings': True,
+            'noprogress': True,
+            'noplaylist': True,
+        }
+
+        # Add platform-specific configurations
+        if platform_info.extractor_args:
+            ydl_opts['extractor_args'] = platform_info.ydl_extractor_args()
+
+        # Add FFmpeg location if available
+        if self.ffmpeg_path == "system":
+            # System FFmpeg is available, yt-dlp will find it automatically
+            logger.info("Using system FFmpeg for yt-dlp")
+        elif self.ffmpeg_path:
+            # Local FFmpeg directory
+            ydl_opts['ffmpeg_location'] = self.ffmpeg_path
+            logger.info(f"Using local FFmpeg for yt-dlp: {self.ffmpeg_path}")
+        else:
+            # If no FFmpeg available, try to download audio-only formats that don't need conversion
+            logger.warning("No FFmpeg available, trying audio-only formats")
+            ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio'
+            # Remove post-processors that require FFmpeg
+            ydl_opts['postprocessors'] = []
+
+        # Add cookie file if available
+        if env.COOKIE_FILE.exists():
+            ydl_opts['cookiefile'] = str(env.COOKIE_FILE)
+
+        return ydl_opts
+
+    async def download_audio(self, query, url: str, quality: str, username: str, user_id: int,
+                             platform_info: Optional[PlatformInfo] = None, preview: Optional[Dict] = None):
+        """Download audio from the given URL with platform-specific handling.
+
+        ``preview`` is the summary shown with the quality buttons; its
+        duration is used for size planning when the full info has expired,
+        and its title when the download has none.
+        """
         start_time = time.time()
-        platform = detect_platform(url)
+        platform_info = platform_info or route_url(url)
+        platform = platform_info.name
 
         try:
             # Update message to show downloading status
@@ -1541,143 +4179,466 @@ Just send me a link to get started! 🎧"""
             temp_dir.mkdir(exist_ok=True)
 
             # Generate unique filename
-            temp_filename = f"audio_{platform.lower().replace('/', '_')}_{int(time.time())}_{user_id}"
+            temp_filename = f"audio_{platform.lower().replace('/', '_')}_{int(time.time())}_{user_id}_{uuid.uuid4().hex[:8]}"
             temp_filepath = temp_dir / temp_filename
 
-            # Set quality-specific options
-            quality_map = {
-                "high": "320",
-                "medium": "192",
-                "low": "128"
-            }
-
-            # Prepare download options for audio only
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'outtmpl': f"{str(temp_filepath)}.%(ext)s",
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': quality_map.get(quality, '192'),
-                }],
-                'quiet': True,
-                'no_warnings': True,
-                'noprogress': True,
-            }
-
-            # Add platform-specific configurations
-            if platform == 'Instagram':
-                ydl_opts.update({
-                    'extractor_args': {
-                        'instagram': {
-                            'include_stories': True,
-                        }
-                    }
-                })
-            elif platform == 'TikTok':
-                ydl_opts.update({
-                    'extractor_args': {
-                        'tiktok': {
-                            'api_hostname': 'api16-normal-c-useast1a.tiktokv.com',
-                        }
-                    }
-                })
-            elif platform == 'Spotify':
+            if platform == 'Spotify':
                 # For Spotify, we'll use a different approach with spotdl-like functionality
                 return await self.download_spotify_audio(query, url, quality, username, user_id)
-            elif platform == 'SoundCloud':
-                # SoundCloud specific options
-                ydl_opts.update({
-                    'extractor_args': {
-                        'soundcloud': {
-                            'client_id': None,  # Let yt-dlp handle this
-                        }
-                    }
-                })
 
-            # Add FFmpeg location if available
-            if self.ffmpeg_path == "system":
-                # System FFmpeg is available, yt-dlp will find it automatically
-                logger.info("Using system FFmpeg for yt-dlp")
-            elif self.ffmpeg_path:
-                # Local FFmpeg directory
-                ydl_opts['ffmpeg_location'] = self.ffmpeg_path
-                logger.info(f"Using local FFmpeg for yt-dlp: {self.ffmpeg_path}")
-            else:
-                # If no FFmpeg available, try to download audio-only formats that don't need conversion
-                logger.warning("No FFmpeg available, trying audio-only formats")
-                ydl_opts['format'] = 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio'
-                # Remove post-processors that require FFmpeg
-                ydl_opts['postprocessors'] = []
+            # Reuse the info extracted for the quality preview, if still fresh
+            cached_info = self.info_cache.get(url) if self.info_cache else None
+
+            # Step down to a quality that fits Telegram's upload limit when one does
+            duration = (cached_info or {}).get('duration') or (preview or {}).get('duration')
+            planned_quality, parts = plan_audio_output(duration, quality, env.MAX_UPLOAD_BYTES)
+            if planned_quality != quality:
+                logger.info(f"Lowering quality {quality} -> {planned_quality} to fit the upload limit for {url}")
+                await query.edit_message_text(
+                    f"🎵 Downloading {platform} audio at {QUALITY_BITRATES[planned_quality]}kbps "
+                    f"so it fits Telegram's upload limit... Please wait."
+                )
+                quality = planned_quality
+            elif parts > 1:
+                logger.info(f"Expecting {parts} parts at {quality} for {url}")
+                await query.edit_message_text(f"🎵 Downloading {platform} audio... It will be sent in {parts} parts.")
 
-            # Add cookie file if available
-            if env.COOKIE_FILE.exists():
-                ydl_opts['cookiefile'] = str(env.COOKIE_FILE)
+            ydl_opts = self.build_download_opts(platform_info, quality, temp_filepath)
 
             download_start = time.time()
-            logger.info(f"Starting audio download for user {username} ({user_id})")
 
-            # Download the audio with timeout handling
-            import yt_dlp
+            base_key = self.resolve_media_key(url)
+            if not base_key and cached_info and cached_info.get('extractor_key') and cached_info.get('id'):
+                base_key = MediaCache.make_base_key(cached_info['extractor_key'], cached_info['id'])
+
+            # Re-send the previous upload if Telegram already has this audio
+            if base_key:
+                record = await self.send_cached_file_id(query, MediaCache.make_key(base_key, audio_variant(quality)))
+                if record:
+                    user_logger.info(f"DOWNLOAD COMPLETE | User: {username} ({user_id}) | Platform: {platform} | Title: {record.get('title')} | URL: {url} | Quality: {quality} | Size: 0.00MB | Time: 0.0s | Cache: FILE_ID")
+                    await query.edit_message_text(f"✅ Audio download completed!\n\n🎵 {record.get('title')}")
+                    return
+
+            # Identical requests in flight share a single download
+            flight_key = MediaCache.make_key(base_key or normalize_url(url), audio_variant(quality))
+            async with self.single_flight.join(
+                flight_key,
+                lambda: self.fetch_audio(url, quality, ydl_opts, temp_dir / temp_filename, cached_info, base_key,
+                                         platform_info),
+                cleanup=self.cleanup_fetched_audio
+            ) as (result, coalesced):
+                downloaded_file = result['path']
+                info = result['info']
+                base_key = result['base_key']
+                cache_status = "SHARED" if coalesced else result['cache_status']
+
+                download_time = time.time() - download_start
+                file_size_mb = downloaded_file.stat().st_size / (1024 * 1024)
+
+                # Log successful download
+                title = info.get('title') or (preview or {}).get('title') or 'Unknown Title'
+                user_logger.info(f"DOWNLOAD COMPLETE | User: {username} ({user_id}) | Platform: {platform} | Title: {title} | URL: {url} | Quality: {quality} | Size: {file_size_mb:.2f}MB | Time: {download_time:.1f}s | Cache: {cache_status}")
+
+                # Send the audio file
+                await query.edit_message_text("📤 Uploading audio file...")
+
+                caption = f"🎵 {title}\n\n📊 Quality: {result['quality_label']}\n📁 Size: {file_size_mb:.1f}MB"
+
+                file_id_key = MediaCache.make_key(base_key, audio_variant(quality)) if base_key else None
+                await self.upload_fetched_audio(query, result, title, caption, file_id_key)
+
+            await query.edit_message_text(f"✅ Audio download completed!\n\n🎵 {title}")
+
+            total_time = time.time() - start_time
+            logger.info(f"Audio download completed for {username} ({user_id}) in {total_time:.1f}s")
+
+        except Exception as e:
+            error_msg = f"❌ {platform} download failed: {str(e)}"
+            debug_write(f"Error downloading audio from {platform}: {e}")
+            user_logger.error(f"DOWNLOAD FAILED | User: {username} ({user_id}) | Platform: {platform} | URL: {url} | Error: {str(e)}")
+
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # Use asyncio.wait_for to add timeout to the download
-                    info = await asyncio.wait_for(
-                        asyncio.get_event_loop().run_in_executor(
-                            None, lambda: ydl.extract_info(url, download=True)
-                        ),
-                        timeout=300  # 5 minute timeout for downloads
-                    )
-            except asyncio.TimeoutError:
-                raise Exception("Download timed out after 5 minutes")
+                await query.edit_message_text(error_msg, final=True)
+            except:
+                await query.message.reply_text(error_msg)
 
-            download_time = time.time() - download_start
+    async def download_youtube_collection(self, query, url: str, quality: str, username: str, user_id: int):
+        """Download every video of a YouTube playlist or channel as audio, several at a time.
 
-            # Find the downloaded file
-            downloaded_files = list(temp_dir.glob(f"{temp_filename}.*"))
-            if not downloaded_files:
-                raise FileNotFoundError("Download failed - no file found")
+        Each entry goes through the same fetch/upload path as a single link,
+        is retried up to BATCH_RETRIES times and is uploaded as soon as it is ready.
+        """
+        start_time = time.time()
+        work_dir = env.STORAGE_DIR / "temp" / f"youtube_batch_{int(time.time())}_{user_id}_{uuid.uuid4().hex[:8]}"
+        work_dir.mkdir(parents=True, exist_ok=True)
 
-            downloaded_file = downloaded_files[0]
-            file_size_mb = downloaded_file.stat().st_size / (1024 * 1024)
+        try:
+            await query.edit_message_text("📃 Reading playlist...")
 
-            # Log successful download
-            title = info.get('title', 'Unknown Title')
-            user_logger.info(f"DOWNLOAD COMPLETE | User: {username} ({user_id}) | Platform: {platform} | Title: {title} | URL: {url} | Quality: {quality} | Size: {file_size_mb:.2f}MB | Time: {download_time:.1f}s")
+            listing = await self.list_youtube_collection(url)
+            entries = [entry for entry in listing.get('entries') or [] if entry and entry.get('id')]
+            if not entries:
+                raise Exception("No videos found in this playlist")
 
-            # Send the audio file
-            await query.edit_message_text("📤 Uploading audio file...")
+            user_logger.info(f"BATCH REQUEST | User: {username} ({user_id}) | Platform: YouTube | Tracks: {len(entries)} | Quality: {quality} | URL: {url}")
+            progress = BatchProgress(f"📃 {listing.get('title', 'YouTube playlist')}", len(entries), query.edit_message_text)
+            await progress.refresh(force=True)
+
+            async def process_entry(index: int, entry: Dict):
+                title = entry.get('title') or entry['id']
+                for attempt in range(env.BATCH_RETRIES + 1):
+                    try:
+                        outcome = await self.scheduler.run_part(user_id, lambda: self.download_youtube_batch_entry(
+                            query, entry, f"{index}/{len(entries)}", quality, work_dir
+                        ))
+                        await progress.record(outcome, title)
+                        return
+                    except Exception as e:
+                        logger.warning(f"Batch entry {title} failed (attempt {attempt + 1}): {e}")
+                        if attempt < env.BATCH_RETRIES:
+                            await asyncio.sleep(2 ** attempt)
+                await progress.record('failed', title)
+
+            await run_batch(entries, process_entry, env.BATCH_PARALLELISM)
+            await progress.finish()
+
+            total_time = time.time() - start_time
+            user_logger.info(f"BATCH COMPLETE | User: {username} ({user_id}) | Platform: YouTube | URL: {url} | Quality: {quality} | Downloaded: {progress.done} | Cached: {progress.cached} | Failed: {progress.failed} | Time: {total_time:.1f}s")
+
+        except Exception as e:
+            error_msg = f"❌ YouTube playlist download failed: {str(e)}"
+            debug_write(f"Error downloading YouTube playlist: {e}")
+            user_logger.error(f"DOWNLOAD FAILED | User: {username} ({user_id}) | Platform: YouTube | URL: {url} | Error: {str(e)}")
+
+            try:
+                await query.edit_message_text(error_msg, final=True)
+            except:
+                await query.message.reply_text(error_msg)
 
-            with open(downloaded_file, 'rb') as audio_file:
-                await query.message.reply_audio(
-                    audio=audio_file,
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def download_youtube_batch_entry(self, query, entry: Dict, position: str, quality: str, work_dir: Path) -> str:
+        """Download and upload one playlist entry. Returns 'done' or 'cached'."""
+        entry_url = entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}"
+        if not entry_url.startswith('http'):
+            entry_url = f"https://www.youtube.com/watch?v={entry['id']}"
+
+        # Same size planning as a single link; entries still too large are split on upload
+        quality, _ = plan_audio_output(entry.get('duration'), quality, env.MAX_UPLOAD_BYTES)
+
+        base_key = MediaCache.make_base_key(entry.get('ie_key') or 'Youtube', entry['id'])
+        file_id_key = MediaCache.make_key(base_key, audio_variant(quality))
+
+        if await self.send_cached_file_id(query, file_id_key):
+            return 'cached'
+
+        temp_filepath = work_dir / f"{entry['id']}_{uuid.uuid4().hex[:8]}"
+        ydl_opts = self.build_download_opts(PLATFORMS['YouTube'], quality, temp_filepath)
+
+        async with self.single_flight.join(
+            file_id_key,
+            lambda: self.fetch_audio(entry_url, quality, ydl_opts, temp_filepath, None, base_key,
+                                     PLATFORMS['YouTube']),
+            cleanup=self.cleanup_fetched_audio
+        ) as (result, coalesced):
+            info = result['info']
+            title = info.get('title', entry.get('title', 'Unknown Title'))
+            file_size_mb = result['path'].stat().st_size / (1024 * 1024)
+            caption = f"🎵 {position} {title}\n\n📊 Quality: {result['quality_label']}\n📁 Size: {file_size_mb:.1f}MB"
+            await self.upload_fetched_audio(query, result, title, caption, file_id_key, show_status=False)
+
+        return 'done'
+
+    async def upload_fetched_audio(self, query, result: Dict, title: str, caption: str,
+                                   file_id_key: Optional[str], show_status: bool = True):
+        """Upload a fetched file once per shared result; the other requesters re-send its file_ids.
+
+        Files over the upload limit are split, and the parts' file_ids are
+        kept on the result so waiters don't split and upload them again.
+        """
+        info = result['info']
+        async with result['upload_lock']:
+            if result['part_file_ids']:
+                for file_id, part_caption in result['part_file_ids']:
+                    await query.message.reply_audio(audio=file_id, caption=part_caption)
+            elif result['file_id']:
+                await query.message.reply_audio(audio=result['file_id'], caption=caption)
+            elif result['path'].stat().st_size > env.MAX_UPLOAD_BYTES:
+                parts = await self.send_audio_parts(
+                    query, result['path'], title,
+                    performer=info.get('uploader', 'Unknown'),
+                    duration=info.get('duration'),
+                    quality_label=result['quality_label'],
+                    show_status=show_status
+                )
+                if all(file_id for file_id, _ in parts):
+                    result['part_file_ids'] = parts
+            else:
+                sent_message = await self.send_audio_file(
+                    query,
+                    result['path'],
                     title=title,
                     performer=info.get('uploader', 'Unknown'),
                     duration=info.get('duration'),
-                    caption=f"🎵 {title}\n\n📊 Quality: {quality_map.get(quality, '192')}kbps\n📁 Size: {file_size_mb:.1f}MB"
+                    caption=caption
                 )
 
-            # Clean up
-            downloaded_file.unlink()
-            await query.edit_message_text(f"✅ Audio download completed!\n\n🎵 {title}")
+                media = sent_message.audio or sent_message.document if sent_message else None
+                result['file_id'] = media.file_id if media else None
+                if file_id_key:
+                    self.remember_file_id(file_id_key, sent_message, title, caption)
+
+    async def fetch_audio(self, url: str, quality: str, ydl_opts: Dict, temp_filepath: Path,
+                          cached_info: Optional[Dict], base_key: Optional[str],
+                          platform_info: Optional[PlatformInfo] = None) -> Dict:
+        """Get the audio file for a URL from the media cache or by downloading it.
+
+        Returns a dict with the file ``path``, its ``info``, the ``base_key``
+        and whether the media cache owns the file (``cached``).
+        """
+        cached = None
+        if self.media_cache:
+            if base_key:
+                cached = self.media_cache.get(MediaCache.make_key(base_key, audio_variant(quality)))
+            else:
+                self.media_cache.misses += 1
+
+        result = {
+            'base_key': base_key,
+            'file_id': None,
+            'part_file_ids': None,
+            'upload_lock': asyncio.Lock(),
+            'quality_label': f"{QUALITY_BITRATES.get(quality, 192)}kbps",
+        }
 
-            total_time = time.time() - start_time
-            logger.info(f"Audio download completed for {username} ({user_id}) in {total_time:.1f}s")
+        if cached:
+            logger.info(f"Serving cached audio for {url}")
+            result['quality_label'] = cached.get('quality_label', result['quality_label'])
+            return dict(result, path=cached['path'], info=cached, cached=True, cache_status="HIT")
 
-        except Exception as e:
-            error_msg = f"❌ {platform} download failed: {str(e)}"
-            debug_write(f"Error downloading audio from {platform}: {e}")
-            user_logger.error(f"DOWNLOAD FAILED | User: {username} ({user_id}) | Platform: {platform} | URL: {url} | Error: {str(e)}")
+        logger.info(f"Starting audio download for {url}")
+        platform_info = platform_info or route_url(url)
+        platform = platform_info.name
 
+        # Resolver chain: Cobalt for the links it handles, yt-dlp for everything
+        downloaded_file, info = None, None
+        if self.cobalt and self.transcoder and self.cobalt.matches_url(url):
+            resolve_start = time.monotonic()
             try:
-                await query.edit_message_text(error_msg)
-            except:
-                await query.message.reply_text(error_msg)
+                downloaded_file, info = await self.fetch_with_cobalt(url, quality, temp_filepath, platform_info)
+                self.resolver_stats.record(platform, 'cobalt', time.monotonic() - resolve_start, True)
+            except Exception as e:
+                self.resolver_stats.record(platform, 'cobalt', time.monotonic() - resolve_start, False)
+                logger.warning(f"Cobalt could not fetch {url}, falling back to yt-dlp: {e}")
+
+        if info is None:
+            resolve_start = time.monotonic()
+            try:
+                downloaded_file, info = await self.fetch_with_ytdlp(url, quality, ydl_opts, temp_filepath, cached_info, result)
+            except Exception:
+                self.resolver_stats.record(platform, 'yt-dlp', time.monotonic() - resolve_start, False)
+                raise
+            self.resolver_stats.record(platform, 'yt-dlp', time.monotonic() - resolve_start, True)
+
+        if info.get('extractor_key') and info.get('id'):
+            base_key = MediaCache.make_base_key(info['extractor_key'], info['id'])
+            if self.file_ids:
+                self.file_ids.add_alias(url, base_key)
+
+        # Keep the result for the next request of the same media
+        if self.media_cache and base_key:
+            self.media_cache.add_alias(url, base_key)
+            cached_path = self.media_cache.put(
+                MediaCache.make_key(base_key, audio_variant(quality)),
+                downloaded_file,
+                {
+                    'title': info.get('title', 'Unknown Title'),
+                    'uploader': info.get('uploader', 'Unknown'),
+                    'duration': info.get('duration'),
+                    'quality_label': result['quality_label']
+                }
+            )
+            if cached_path:
+                return dict(result, path=cached_path, info=info, base_key=base_key, cached=True,
+                            cache_status="MISS")
+
+        return dict(result, path=downloaded_file, info=info, base_key=base_key, cached=False,
+                    cache_status="MISS" if self.media_cache else "OFF")
+
+    async def fetch_with_cobalt(self, url: str, quality: str, temp_filepath: Path,
+                                platform_info: PlatformInfo) -> Tuple[Path, Dict]:
+        """Resolve a link with Cobalt and stream the direct media URL into FFmpeg."""
+        resolved = await self.cobalt.resolve_url(url)
+        audio_url = CobaltAPI.get_audio_url(resolved)
+        if not audio_url:
+            error = resolved.get('error') or {}
+            raise RuntimeError(f"Cobalt returned {resolved.get('status')}: {error.get('code', 'no audio')}")
+
+        self.audio_path_stats['transcode'] += 1
+        downloaded_file = await self.transcoder.transcode_url(
+            audio_url,
+            Path(f"{temp_filepath}.mp3"),
+            ["-c:a", "libmp3lame", "-b:a", f"{QUALITY_BITRATES.get(quality, 192)}k"],
+            timeout=300  # 5 minute timeout for downloads
+        )
+
+        filename = resolved.get('filename') or resolved.get('audioFilename') or ""
+        # Same extractor and id as canonical_media_key, so yt-dlp and Cobalt downloads share cache entries
+        extractor_key, media_id = canonicalize_url(url) or (None, None)
+        info = {
+            'title': Path(filename).stem or f"{platform_info.name} audio",
+            'uploader': platform_info.name,
+            'duration': None,
+            'extractor_key': extractor_key,
+            'id': media_id,
+        }
+        return downloaded_file, info
+
+    async def fetch_with_ytdlp(self, url: str, quality: str, ydl_opts: Dict, temp_filepath: Path,
+                               cached_info: Optional[Dict], result: Dict) -> Tuple[Path, Dict]:
+        """Download audio with yt-dlp, reusing previously extracted info when available."""
+        # Download the audio with timeout handling
+        try:
+            info = None
+            downloaded_file = None
+
+            # Stream straight into FFmpeg when we already know what to fetch
+            if self.transcoder and env.STREAM_TRANSCODE and cached_info:
+                try:
+                    downloaded_file, info = await self.stream_audio(cached_info, quality, ydl_opts, temp_filepath)
+                except (RuntimeError, OSError, asyncio.TimeoutError) as e:
+                    logger.warning(f"Streaming transcode failed, falling back to regular download: {e}")
+
+            if info is None and cached_info:
+                try:
+                    info = await self.ytdl_pool.run(
+                        {'info': cached_info, 'ydl_opts': ydl_opts, 'download': True,
+                         'copy_band': audio_bitrate_band(quality)},
+                        timeout=300  # 5 minute timeout for downloads
+                    )
+                except RuntimeError as e:
+                    # Format URLs may have expired; extract again below
+                    logger.warning(f"Download from cached info failed, re-extracting: {e}")
+
+            if info is None:
+                info = await self.ytdl_pool.run(
+                    {'url': url, 'ydl_opts': ydl_opts, 'download': True,
+                     'copy_band': audio_bitrate_band(quality)},
+                    timeout=300  # 5 minute timeout for downloads
+                )
+        except asyncio.TimeoutError:
+            raise Exception("Download timed out after 5 minutes")
+
+        # Find the downloaded file
+        if downloaded_file is None:
+            downloaded_files = list(temp_filepath.parent.glob(f"{temp_filepath.name}.*"))
+            if not downloaded_files:
+                raise FileNotFoundError("Download failed - no file found")
+
+            downloaded_file = downloaded_files[0]
+
+        # Native sources within the tier's band were copied; everything else was converted to MP3
+        source_ext = ytdl_worker.native_audio_ext(info, audio_bitrate_band(quality))
+        if source_ext and downloaded_file.suffix == f".{source_ext}":
+            abr = info.get('abr') or QUALITY_BITRATES.get(quality, 192)
+            result['quality_label'] = f"{abr:.0f}kbps (original {source_ext.upper()})"
+            self.audio_path_stats['remux'] += 1
+            self.audio_path_stats['remuxed_seconds'] += info.get('duration') or 0
+            logger.info(f"Audio path: copied format {info.get('format_id')} ({info.get('acodec')}, {abr:.0f}kbps) for {url}")
+        else:
+            self.audio_path_stats['transcode'] += 1
+            logger.info(f"Audio path: transcoded format {info.get('format_id')} to MP3 {QUALITY_BITRATES.get(quality, 192)}kbps for {url}")
+
+        return downloaded_file, info
+
+    async def stream_audio(self, info: Dict, quality: str, ydl_opts: Dict, temp_filepath: Path) -> Tuple[Path, Dict]:
+        """Download and encode audio in one pass with the streaming transcoder.
+
+        The format is picked by a warm worker with the same options as a
+        regular download; FFmpeg then reads the chosen format's URL, copying
+        it or encoding it to MP3 by the same rule. Returns the file and
+        the info of the selected format.
+        """
+        selected = await self.ytdl_pool.run(
+            {'info': info, 'ydl_opts': dict(ydl_opts, postprocessors=[]), 'download': False},
+            timeout=60
+        )
+        # A merge of several formats has a format_id none of them have
+        formats = selected.get('formats')
+        fmt = next((f for f in formats if f.get('format_id') == selected.get('format_id')), None) if formats else selected
+        if fmt is None:
+            raise RuntimeError(f"Selected format {selected.get('format_id')} needs merging")
+        if fmt.get('acodec') == 'none':
+            raise RuntimeError(f"Selected format {selected.get('format_id')} has no audio")
+        if selected.get('protocol') not in STREAMABLE_PROTOCOLS or not selected.get('url'):
+            raise RuntimeError(f"Cannot stream protocol {selected.get('protocol')}")
+        if selected.get('cookies'):
+            # FFmpeg would fetch without the cookies yt-dlp uses
+            raise RuntimeError("Selected format needs cookies")
+
+        native_ext = ytdl_worker.native_audio_ext(selected, audio_bitrate_band(quality))
+        if native_ext:
+            output, codec_args = Path(f"{temp_filepath}.{native_ext}"), ["-c:a", "copy"]
+        else:
+            output = Path(f"{temp_filepath}.mp3")
+            codec_args = ["-c:a", "libmp3lame", "-b:a", f"{QUALITY_BITRATES.get(quality, 192)}k"]
+
+        downloaded_file = await self.transcoder.transcode_url(
+            selected['url'],
+            output,
+            codec_args,
+            timeout=300,  # 5 minute timeout for downloads
+            headers=selected.get('http_headers')
+        )
+        return downloaded_file, selected
+
+    def cleanup_fetched_audio(self, result: Dict):
+        """Delete a fetched file once nobody needs it, unless the media cache owns it."""
+        if not result['cached']:
+            try:
+                result['path'].unlink(missing_ok=True)
+            except Exception as e:
+                logger.warning(f"Could not remove {result['path']}: {e}")
+
+    def build_spotdl_command(self, url: str, bitrate: str, output_dir: Path) -> List[str]:
+        """Build the spotdl command line to download a Spotify URL as MP3 into ``output_dir``."""
+        # Prepare spotdl command (updated for spotdl 4.x format)
+        spotdl_cmd = [
+            "spotdl",
+            "download",  # Required operation for spotdl 4.x
+            url,  # URL comes after operation
+            "--bitrate", f"{bitrate}k",
+            "--format", "mp3",
+            "--output", str(output_dir),
+            "--simple-tui"  # Plain progress lines we can parse
+        ]
+
+        # Add FFmpeg path explicitly for spotdl 4.x
+        if self.ffmpeg_path == "system":
+            # For system FFmpeg, let spotdl find it or use the downloaded one
+            logger.info("Using system FFmpeg for spotdl")
+        elif self.ffmpeg_path:
+            # For local FFmpeg, specify the path explicitly
+            import platform
+            system = platform.system().lower()
+            if system == "windows":
+                ffmpeg_exe = Path(self.ffmpeg_path) / "ffmpeg.exe"
+            else:
+                ffmpeg_exe = Path(self.ffmpeg_path) / "ffmpeg"
+
+            if ffmpeg_exe.exists():
+                spotdl_cmd.extend(["--ffmpeg", str(ffmpeg_exe)])
+                logger.info(f"Using local FFmpeg for spotdl: {ffmpeg_exe}")
+            else:
+                logger.warning(f"FFmpeg not found at expected path: {ffmpeg_exe}")
+        else:
+            logger.warning("No FFmpeg configured - spotdl may fail")
+
+        return spotdl_cmd
 
     async def download_spotify_audio(self, query, url: str, quality: str, username: str, user_id: int):
         """Download Spotify audio using spotdl command-line tool."""
-        # Import subprocess at method level to ensure it's available throughout the method
-        import subprocess as sp  # Use alias to avoid any potential conflicts
         start_time = time.time()
 
         try:
@@ -1689,7 +4650,7 @@ Just send me a link to get started! 🎧"""
             temp_dir.mkdir(exist_ok=True)
 
             # Generate unique output directory for this download
-            output_dir = temp_dir / f"spotify_{int(time.time())}_{user_id}"
+            output_dir = temp_dir / f"spotify_{int(time.time())}_{user_id}_{uuid.uuid4().hex[:8]}"
             output_dir.mkdir(exist_ok=True)
 
             # Set quality-specific options
@@ -1701,44 +4662,20 @@ Just send me a link to get started! 🎧"""
 
             bitrate = quality_map.get(quality, '192')
 
-            # Prepare spotdl command (updated for spotdl 4.x format)
-            spotdl_cmd = [
-                "spotdl",
-                "download",  # Required operation for spotdl 4.x
-                url,  # URL comes after operation
-                "--bitrate", f"{bitrate}k",
-                "--format", "mp3",
-                "--output", str(output_dir)
-            ]
-
-            # Add FFmpeg path explicitly for spotdl 4.x
-            if self.ffmpeg_path == "system":
-                # For system FFmpeg, let spotdl find it or use the downloaded one
-                logger.info("Using system FFmpeg for spotdl")
-            elif self.ffmpeg_path:
-                # For local FFmpeg, specify the path explicitly
-                import platform
-                system = platform.system().lower()
-                if system == "windows":
-                    ffmpeg_exe = Path(self.ffmpeg_path) / "ffmpeg.exe"
-                else:
-                    ffmpeg_exe = Path(self.ffmpeg_path) / "ffmpeg"
+            # Re-send the previous upload if Telegram already has this track
+            track_id = self.extract_spotify_track_id(url)
+            file_id_key = MediaCache.make_key(MediaCache.make_base_key("spotify", track_id), quality) if track_id else None
+            if file_id_key:
+                record = await self.send_cached_file_id(query, file_id_key)
+                if record:
+                    user_logger.info(f"DOWNLOAD COMPLETE | User: {username} ({user_id}) | Platform: Spotify | Title: {record.get('title')} | URL: {url} | Quality: {quality} | Size: 0.00MB | Time: 0.0s | Cache: FILE_ID")
+                    await query.edit_message_text(f"✅ Spotify download completed!\n\n🎵 {record.get('title')}")
+                    return
 
-                if ffmpeg_exe.exists():
-                    spotdl_cmd.extend(["--ffmpeg", str(ffmpeg_exe)])
-                    logger.info(f"Using local FFmpeg for spotdl: {ffmpeg_exe}")
-                else:
-                    logger.warning(f"FFmpeg not found at expected path: {ffmpeg_exe}")
-            else:
-                logger.warning("No FFmpeg configured - spotdl may fail")
+            spotdl_cmd = self.build_spotdl_command(url, bitrate, output_dir)
 
             # Check if spotdl is available
-            try:
-                spotdl_check = subprocess.run(["spotdl", "--version"], capture_output=True, text=True, timeout=10)
-                if spotdl_check.returncode != 0:
-                    raise FileNotFoundError("spotdl not found")
-                logger.info(f"Using spotdl version: {spotdl_check.stdout.strip()}")
-            except (FileNotFoundError, subprocess.TimeoutExpired):
+            if not await self.get_spotdl_version():
                 raise Exception("spotdl is not installed. Please install it with: pip install spotdl")
 
             # FFmpeg should already be configured during bot initialization
@@ -1752,28 +4689,19 @@ Just send me a link to get started! 🎧"""
             download_start = time.time()
             logger.info(f"Starting spotdl download for user {username} ({user_id})")
 
-            # Run spotdl command with timeout and error handling
-            try:
-                result = await asyncio.wait_for(
-                    asyncio.get_event_loop().run_in_executor(
-                        None,
-                        lambda: sp.run(
-                            spotdl_cmd,
-                            capture_output=True,
-                            text=True,
-                            timeout=300,  # 5 minute timeout
-                            cwd=str(output_dir)
-                        )
-                    ),
-                    timeout=320  # Slightly longer timeout for asyncio
-                )
-            except asyncio.TimeoutError:
-                raise Exception("Spotify download timed out after 5 minutes")
+            # Run spotdl, relaying its progress to the status message
+            async def show_progress(status: str):
+                await query.edit_message_text(f"🎵 Downloading with spotdl...\n\n{status}")
+
+            returncode, output = await self.run_spotdl(
+                spotdl_cmd, output_dir, show_progress,
+                timeout=300  # 5 minute timeout
+            )
 
             download_time = time.time() - download_start
 
-            if result.returncode != 0:
-                error_output = result.stderr or result.stdout
+            if returncode != 0:
+                error_output = output
                 logger.warning(f"spotdl failed with error: {error_output}")
 
                 # Check if the error is related to FFmpeg
@@ -1820,13 +4748,17 @@ Just send me a link to get started! 🎧"""
             # Send the audio file
             await query.edit_message_text("📤 Uploading audio file...")
 
-            with open(downloaded_file, 'rb') as audio_file:
-                await query.message.reply_audio(
-                    audio=audio_file,
-                    title=title,
-                    performer=artist,
-                    caption=f"🎵 {full_title}\n\n📊 Quality: {bitrate}kbps\n📁 Size: {file_size_mb:.1f}MB\n🎧 Source: Spotify (via spotdl)"
-                )
+            caption = f"🎵 {full_title}\n\n📊 Quality: {bitrate}kbps\n📁 Size: {file_size_mb:.1f}MB\n🎧 Source: Spotify (via spotdl)"
+            sent_message = await self.send_audio_file(
+                query,
+                downloaded_file,
+                title=title,
+                performer=artist,
+                caption=caption
+            )
+
+            if file_id_key:
+                self.remember_file_id(file_id_key, sent_message, full_title, caption)
 
             # Clean up
             import shutil
@@ -1836,13 +4768,13 @@ Just send me a link to get started! 🎧"""
             total_time = time.time() - start_time
             logger.info(f"Spotify download completed for {username} ({user_id}) in {total_time:.1f}s")
 
-        except sp.TimeoutExpired:
+        except asyncio.TimeoutError:
             error_msg = "❌ Spotify download timed out (5 minutes). The track might be too long or there's a network issue."
             debug_write(f"Spotify download timeout for user {username} ({user_id})")
             user_logger.error(f"DOWNLOAD TIMEOUT | User: {username} ({user_id}) | Platform: Spotify | URL: {url}")
 
             try:
-                await query.edit_message_text(error_msg)
+                await query.edit_message_text(error_msg, final=True)
             except:
                 await query.message.reply_text(error_msg)
 
@@ -1852,7 +4784,7 @@ Just send me a link to get started! 🎧"""
             user_logger.error(f"DOWNLOAD FAILED | User: {username} ({user_id}) | Platform: Spotify | URL: {url} | Error: {str(e)}")
 
             try:
-                await query.edit_message_text(error_msg)
+                await query.edit_message_text(error_msg, final=True)
             except:
                 await query.message.reply_text(error_msg)
 
@@ -1865,6 +4797,207 @@ Just send me a link to get started! 🎧"""
             except:
                 pass
 
+    async def run_spotdl(self, cmd: List[str], cwd: Path, on_progress: Callable[[str], Awaitable],
+                         timeout: float, min_interval: float = 3.0) -> Tuple[int, str]:
+        """Run spotdl asynchronously, reporting progress as its output arrives.
+
+        ``on_progress`` is called at most every ``min_interval`` seconds and
+        only when the status changed. The child is killed on timeout or
+        cancellation. Returns the exit code and the tail of the output.
+        """
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=str(cwd)
+        )
+
+        output_lines = deque(maxlen=200)
+        last_status = None
+        last_update = 0.0
+
+        async def read_output():
+            nonlocal last_status, last_update
+            buffer = b""
+            while True:
+                chunk = await process.stdout.read(4096)
+                if not chunk:
+                    break
+                buffer += chunk
+                # Progress bars redraw with carriage returns, so split on both
+                *lines, buffer = re.split(rb"[\r\n]", buffer)
+                for raw_line in lines:
+                    line = raw_line.decode(errors='replace').strip()
+                    if not line:
+                        continue
+                    output_lines.append(line)
+                    status = parse_spotdl_progress(line)
+                    now = time.monotonic()
+                    if status and status != last_status and now - last_update >= min_interval:
+                        last_status, last_update = status, now
+                        try:
+                            await on_progress(status)
+                        except Exception as e:
+                            debug_write(f"Could not update spotdl progress: {e}")
+            if buffer.strip():
+                output_lines.append(buffer.decode(errors='replace').strip())
+            await process.wait()
+
+        try:
+            await asyncio.wait_for(read_output(), timeout=timeout)
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+
+        return process.returncode, "\n".join(output_lines)
+
+    async def download_spotify_collection(self, query, url: str, quality: str, username: str, user_id: int):
+        """Download every track of a Spotify playlist or album, several at a time.
+
+        Tracks are uploaded as soon as each one is ready. Tracks Telegram
+        already has a file_id for are re-sent without downloading.
+        """
+        start_time = time.time()
+        kind = self.extract_spotify_collection_kind(url) or "playlist"
+        work_dir = env.STORAGE_DIR / "temp" / f"spotify_batch_{int(time.time())}_{user_id}_{uuid.uuid4().hex[:8]}"
+        work_dir.mkdir(parents=True, exist_ok=True)
+
+        try:
+            await query.edit_message_text(f"📀 Reading Spotify {kind}...")
+
+            if not await self.get_spotdl_version():
+                raise Exception("spotdl is not installed. Please install it with: pip install spotdl")
+
+            tracks = await self.expand_spotify_collection(url, work_dir)
+            if not tracks:
+                raise Exception(f"No tracks found in this {kind}")
+
+            if len(tracks) > env.BATCH_MAX_TRACKS:
+                await query.message.reply_text(f"⚠️ Only the first {env.BATCH_MAX_TRACKS} of {len(tracks)} tracks will be downloaded.")
+                tracks = tracks[:env.BATCH_MAX_TRACKS]
+
+            user_logger.info(f"BATCH REQUEST | User: {username} ({user_id}) | Platform: Spotify | Tracks: {len(tracks)} | URL: {url}")
+            progress = BatchProgress(f"📀 Spotify {kind}", len(tracks), query.edit_message_text)
+            await progress.refresh(force=True)
+
+            async def process_track(index: int, track: Dict):
+                artist = track.get('artist') or ", ".join(track.get('artists') or []) or "Unknown Artist"
+                full_title = f"{artist} - {track.get('name', 'Unknown Title')}"
+                try:
+                    outcome = await self.scheduler.run_part(user_id, lambda: self.download_spotify_batch_track(
+                        query, track, f"{index}/{len(tracks)}", full_title, quality, work_dir
+                    ))
+                    await progress.record(outcome, full_title)
+                except Exception as e:
+                    logger.warning(f"Batch track {full_title} failed: {e}")
+                    await progress.record('failed', full_title)
+
+            await run_batch(tracks, process_track, env.BATCH_PARALLELISM)
+            await progress.finish()
+
+            total_time = time.time() - start_time
+            user_logger.info(f"BATCH COMPLETE | User: {username} ({user_id}) | Platform: Spotify | URL: {url} | Downloaded: {progress.done} | Cached: {progress.cached} | Failed: {progress.failed} | Time: {total_time:.1f}s")
+
+        except Exception as e:
+            error_msg = f"❌ Spotify {kind} download failed: {str(e)}"
+            debug_write(f"Error downloading Spotify {kind}: {e}")
+            user_logger.error(f"DOWNLOAD FAILED | User: {username} ({user_id}) | Platform: Spotify | URL: {url} | Error: {str(e)}")
+
+            try:
+                await query.edit_message_text(error_msg, final=True)
+            except:
+                await query.message.reply_text(error_msg)
+
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def expand_spotify_collection(self, url: str, work_dir: Path) -> List[Dict]:
+        """List the tracks of a Spotify playlist or album using ``spotdl save``."""
+        save_file = work_dir / "tracks.spotdl"
+
+        async def ignore_progress(status: str):
+            pass
+
+        returncode, output = await self.run_spotdl(
+            ["spotdl", "save", url, "--save-file", str(save_file)],
+            work_dir, ignore_progress,
+            timeout=120
+        )
+        if returncode != 0 or not save_file.exists():
+            raise Exception(f"Could not read the track list: {output[-200:]}")
+
+        with open(save_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def download_spotify_batch_track(self, query, track: Dict, position: str, full_title: str,
+                                           quality: str, work_dir: Path) -> str:
+        """Download and upload one track of a batch. Returns 'done' or 'cached'."""
+        bitrate = str(QUALITY_BITRATES.get(quality, 192))
+        track_id = track.get('song_id') or self.extract_spotify_track_id(track.get('url', ''))
+        file_id_key = MediaCache.make_key(MediaCache.make_base_key("spotify", track_id), quality) if track_id else None
+        caption = f"🎵 {position} {full_title}\n\n📊 Quality: {bitrate}kbps\n🎧 Source: Spotify"
+
+        # Tracks sent before are re-sent by file_id
+        if file_id_key:
+            record = await self.send_cached_file_id(query, file_id_key)
+            if record:
+                return 'cached'
+
+        track_dir = work_dir / (track_id or uuid.uuid4().hex)
+        track_dir.mkdir(exist_ok=True)
+
+        # spotdl first, YouTube search as the fallback
+        downloaded_file = None
+        fetched = None
+        try:
+            async def ignore_progress(status: str):
+                pass
+
+            returncode, output = await self.run_spotdl(
+                self.build_spotdl_command(track['url'], bitrate, track_dir),
+                track_dir, ignore_progress,
+                timeout=300
+            )
+            downloaded_files = list(track_dir.glob("*.mp3"))
+            if returncode == 0 and downloaded_files:
+                downloaded_file = downloaded_files[0]
+            else:
+                logger.warning(f"spotdl failed for {full_title}, trying YouTube: {output[-200:]}")
+        except asyncio.TimeoutError:
+            logger.warning(f"spotdl timed out for {full_title}, trying YouTube")
+
+        try:
+            if not downloaded_file:
+                youtube_url = await self.search_youtube_for_spotify_track(full_title.replace(" - ", " "))
+                if not youtube_url:
+                    raise Exception("Could not find track on YouTube")
+
+                fetched = await self.fetch_audio(
+                    youtube_url, quality,
+                    self.build_download_opts(PLATFORMS['YouTube'], quality, track_dir / "audio"),
+                    track_dir / "audio", None, self.resolve_media_key(youtube_url), PLATFORMS['YouTube']
+                )
+                downloaded_file = fetched['path']
+
+            artist, _, title = full_title.partition(" - ")
+            sent_message = await self.send_audio_file(
+                query,
+                downloaded_file,
+                title=title,
+                performer=artist,
+                caption=caption
+            )
+
+            if file_id_key:
+                self.remember_file_id(file_id_key, sent_message, full_title, caption)
+            return 'done'
+        finally:
+            if fetched:
+                self.cleanup_fetched_audio(fetched)
+            shutil.rmtree(track_dir, ignore_errors=True)
+
     async def download_spotify_fallback(self, query, url: str, quality: str, username: str, user_id: int):
         """Fallback method to download Spotify tracks via YouTube search."""
         try:
@@ -1927,12 +5060,14 @@ Just send me a link to get started! 🎧"""
             debug_write(f"Error extracting Spotify track ID: {e}")
             return None
 
+    def extract_spotify_collection_kind(self, url: str) -> Optional[str]:
+        """Return "playlist" or "album" for Spotify collection URLs."""
+        match = re.search(r'/(playlist|album)/([a-zA-Z0-9]+)', url)
+        return match.group(1) if match else None
+
     async def get_spotify_track_metadata(self, track_id: str):
         """Get track metadata using web scraping approach."""
         try:
-            import requests
-            import re
-
             # Try to get basic info from Spotify's public page
             track_url = f"https://open.spotify.com/track/{track_id}"
 
@@ -1940,9 +5075,7 @@ Just send me a link to get started! 🎧"""
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
 
-            response = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: requests.get(track_url, headers=headers, timeout=10)
-            )
+            response = await self.http.get(track_url, headers=headers, timeout=10)
 
             if response.status_code == 200:
                 html = response.text
@@ -2022,8 +5155,6 @@ Just send me a link to get started! 🎧"""
     async def search_youtube_for_spotify_track(self, search_query: str):
         """Search YouTube for a Spotify track."""
         try:
-            import yt_dlp
-
             # Search YouTube for the track
             ydl_opts = {
                 'quiet': True,
@@ -2032,14 +5163,10 @@ Just send me a link to get started! 🎧"""
             }
 
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    # Add timeout for YouTube search
-                    search_results = await asyncio.wait_for(
-                        asyncio.get_event_loop().run_in_executor(
-                            None, lambda: ydl.extract_info(search_query, download=False)
-                        ),
-                        timeout=30  # 30 second timeout for search
-                    )
+                search_results = await self.ytdl_pool.run(
+                    {'url': search_query, 'ydl_opts': ydl_opts, 'download': False},
+                    timeout=30  # 30 second timeout for search
+                )
             except asyncio.TimeoutError:
                 debug_write("YouTube search timed out")
                 return None
@@ -2098,6 +5225,7 @@ Just send me a link to get started! 🎧"""
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.handle_start))
         self.application.add_handler(CommandHandler("help", self.handle_help))
+        self.application.add_handler(CommandHandler("stats", self.handle_stats))
         
         # Main message handler with URL detection
         self.application.add_handler(
@@ -2445,6 +5573,11 @@ def fix_bot_token():
     return False
 
 if __name__ == "__main__":
+    # Check for required environment variables
+    if not env.BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN is not set. Bot cannot start.")
+        exit(1)
+
     debug_write("Bot script started directly")
     
     # Clear webhook settings immediately
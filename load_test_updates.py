@@ -0,0 +1,52 @@
+"""Compare update latency with sequential and per-user concurrent processing.
+
+Run ``python load_test_updates.py``. User 0 sends slow updates (like a long
+extraction), everyone else sends fast ones. Reports latency percentiles and
+checks per-user ordering. No bot token or network access is needed.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Tuple
+
+from bot import PerUserUpdateProcessor
+
+async def run(processor, users: int, updates_per_user: int, slow_delay: float,
+              fast_delay: float) -> Tuple[List[float], bool]:
+    latencies = []
+    handled: Dict[int, List[int]] = {}
+
+    async def handler(user_id: int, sequence: int, delay: float, queued_at: float):
+        await asyncio.sleep(delay)
+        handled.setdefault(user_id, []).append(sequence)
+        if user_id != 0:
+            latencies.append(time.perf_counter() - queued_at)
+
+    tasks = []
+    for sequence in range(updates_per_user):
+        for user_id in range(users):
+            update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+            delay = slow_delay if user_id == 0 else fast_delay
+            coroutine = handler(user_id, sequence, delay, time.perf_counter())
+            tasks.append(asyncio.create_task(processor.process_update(update, coroutine)))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+
+    ordered = all(sequences == sorted(sequences) for sequences in handled.values())
+    return sorted(latencies), ordered
+
+def report(label: str, latencies: List[float], ordered: bool):
+    p50 = latencies[len(latencies) // 2]
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:24} p50 {p50 * 1000:8.0f}ms  p95 {p95 * 1000:8.0f}ms  "
+          f"max {latencies[-1] * 1000:8.0f}ms  per-user order kept: {ordered}")
+
+def main(users: int = 20, updates_per_user: int = 3, slow_delay: float = 2.0,
+         fast_delay: float = 0.05, concurrency: int = 32):
+    print(f"{users} users x {updates_per_user} updates; user 0 takes {slow_delay}s per update, others {fast_delay}s")
+    args = (users, updates_per_user, slow_delay, fast_delay)
+    report("sequential (default)", *asyncio.run(run(PerUserUpdateProcessor(1), *args)))
+    report(f"concurrent ({concurrency})", *asyncio.run(run(PerUserUpdateProcessor(concurrency), *args)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Minimal stand-in for a local Bot API server, for trying out TELEGRAM_API_ROOT.
+
+Run ``python mock_bot_api.py [port]`` and start the bot with
+TELEGRAM_API_ROOT=http://127.0.0.1:<port>. Send requests are answered with
+fake messages and logged with whether the file came as a local path or as
+an upload. Needs nothing but the standard library.
+"""
+import json
+import sys
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs
+
+counter = {'message_id': 0}
+
+def fake_chat(chat_id) -> dict:
+    """Chat object for a chat_id, which may be a number or an @username."""
+    if isinstance(chat_id, str) and chat_id.startswith('@'):
+        # Channels addressed by username get a stable made-up id
+        return {
+            'id': -1000000000000 - zlib.crc32(chat_id.encode()),
+            'type': 'channel',
+            'title': chat_id,
+            'username': chat_id[1:],
+        }
+
+    chat_id = int(chat_id or 0)
+    if chat_id < 0:
+        return {'id': chat_id, 'type': 'supergroup', 'title': 'Mock group'}
+    return {'id': chat_id, 'type': 'private', 'first_name': 'Mock'}
+
+def fake_message(chat_id, fields: dict) -> dict:
+    counter['message_id'] += 1
+    message = {
+        'message_id': counter['message_id'],
+        'date': int(time.time()),
+        'chat': fake_chat(chat_id),
+    }
+    if 'audio' in fields:
+        message['audio'] = {
+            'file_id': f"mock-audio-{counter['message_id']}",
+            'file_unique_id': f"mock-{counter['message_id']}",
+            'duration': 0,
+        }
+    if 'text' in fields:
+        message['text'] = fields['text']
+    return message
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        method = self.path.rstrip('/').rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        content_type = self.headers.get('Content-Type', '')
+
+        if content_type.startswith('application/json'):
+            fields = json.loads(body or b'{}')
+        elif content_type.startswith('multipart/form-data'):
+            fields = {'audio': None}
+            print(f"{method}: multipart upload of {len(body)} bytes")
+        else:
+            fields = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+        audio = fields.get('audio')
+        if isinstance(audio, str) and audio.startswith('file://'):
+            local_path = Path(audio[len('file://'):])
+            print(f"{method}: local file {local_path} exists={local_path.exists()}")
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Mock', 'username': 'mock_bot'}
+        elif method == 'getUpdates':
+            time.sleep(min(float(fields.get('timeout', 0) or 0), 5))
+            result = []
+        elif method.startswith('send') or method.startswith('edit'):
+            result = fake_message(fields.get('chat_id'), fields)
+        else:
+            result = True
+
+        payload = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST
+
+def run(port: int = 8081):
+    print(f"Mock Bot API server listening on http://127.0.0.1:{port}")
+    ThreadingHTTPServer(('127.0.0.1', port), Handler).serve_forever()
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 8081)
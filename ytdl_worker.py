@@ -0,0 +1,131 @@
+import copy
+import os
+import signal
+from typing import Optional
+
+# yt-dlp is imported once per worker process by init_worker
+yt_dlp = None
+
+def init_worker():
+    """Prepare a worker process: import yt-dlp and leave Ctrl+C to the parent."""
+    global yt_dlp
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    except Exception:
+        pass
+
+    import yt_dlp as _yt_dlp
+    yt_dlp = _yt_dlp
+
+# Top-level keys format selection copies into a processed info dict
+SELECTION_KEYS = {
+    'requested_formats', 'requested_downloads', 'format', 'format_id', 'format_note', 'ext', 'url',
+    'manifest_url', 'protocol', 'acodec', 'vcodec', 'abr', 'vbr', 'tbr', 'asr', 'audio_channels',
+    'width', 'height', 'fps', 'resolution', 'dynamic_range', 'aspect_ratio', 'stretched_ratio',
+    'filesize', 'filesize_approx', 'fragments', 'downloader_options',
+}
+
+def clear_format_selection(info: dict) -> dict:
+    """Copy of an info dict without the result of an earlier format selection.
+
+    yt-dlp copies the chosen format onto the info dict and never clears
+    ``requested_formats``, so processing it again would repeat the old
+    (video + audio) selection whatever ``format`` asks for.
+    """
+    if not info.get('formats'):
+        # The info dict is its own single format
+        return info
+    selected = info.get('requested_formats') or [
+        fmt for fmt in info['formats'] if fmt.get('format_id') == info.get('format_id')
+    ]
+    stale = SELECTION_KEYS.union(*(fmt.keys() for fmt in selected))
+    return {key: value for key, value in info.items() if key not in stale}
+
+# Audio formats Telegram plays natively, sent without re-encoding
+NATIVE_AUDIO_EXTS = ('m4a', 'mp3')
+
+def native_audio_ext(fmt: dict, copy_band) -> Optional[str]:
+    """Extension to keep a selected format in, or None if it should be converted to MP3.
+
+    Only native formats with a bitrate within ``copy_band`` (low, high kbps)
+    are kept, so each band yields its own output.
+    """
+    low, high = copy_band
+    abr = fmt.get('abr') or fmt.get('tbr') or 0
+    if fmt.get('ext') in NATIVE_AUDIO_EXTS and low <= abr <= high:
+        return fmt['ext']
+    return None
+
+def select_audio_output(job: dict, ydl_opts: dict):
+    """Select the format, then keep it as is or convert it to MP3 (see native_audio_ext).
+
+    Returns the options for the download and the info dict to process.
+    """
+    with yt_dlp.YoutubeDL(dict(ydl_opts, postprocessors=[])) as ydl:
+        if job.get('info'):
+            info = clear_format_selection(job['info'])
+        else:
+            info = ydl.extract_info(job['url'], download=False, process=False)
+        selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+
+    if selected.get('format_id'):
+        ydl_opts = dict(ydl_opts, format=selected['format_id'])
+    ext = native_audio_ext(selected, job['copy_band'])
+    if ext and ydl_opts.get('postprocessors'):
+        ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': ext}]
+    return ydl_opts, info
+
+def warm_up() -> int:
+    """No-op job used to start worker processes ahead of the first request."""
+    return os.getpid()
+
+def run_job(job: dict) -> dict:
+    """Run a single yt-dlp job and return the sanitized info dict.
+
+    ``job`` holds only plain data so it can be sent to another process:
+      - url: the URL to extract (ignored if ``info`` is given)
+      - info: a previously extracted info dict to process instead of a URL,
+        which skips fetching the webpage and player again
+      - ydl_opts: options for YoutubeDL
+      - download: whether to download (and postprocess) the media
+      - cancel_file: optional path; the job aborts once this file exists
+      - pid_file: optional path the worker's pid is written to, so the
+        parent can kill a job that hangs before it checks ``cancel_file``
+      - copy_band: optional (low, high) kbps; when downloading, the selected
+        format is copied if native_audio_ext allows, else converted to MP3
+    """
+    if yt_dlp is None:
+        init_worker()
+
+    ydl_opts = dict(job.get('ydl_opts') or {})
+    cancel_file = job.get('cancel_file')
+
+    if job.get('pid_file'):
+        with open(job['pid_file'], 'w') as f:
+            f.write(str(os.getpid()))
+
+    if cancel_file and os.path.exists(cancel_file):
+        raise RuntimeError("Job was cancelled")
+
+    if cancel_file:
+        def check_cancelled(_status):
+            if os.path.exists(cancel_file):
+                raise yt_dlp.utils.DownloadCancelled("Job was cancelled")
+
+        ydl_opts['progress_hooks'] = [check_cancelled]
+        ydl_opts['postprocessor_hooks'] = [check_cancelled]
+
+    try:
+        if job.get('copy_band') and job.get('download'):
+            ydl_opts, info = select_audio_output(job, ydl_opts)
+            job = dict(job, info=info)
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            if job.get('info'):
+                info = ydl.process_ie_result(clear_format_selection(job['info']), download=job.get('download', False))
+            else:
+                info = ydl.extract_info(job['url'], download=job.get('download', False))
+            return ydl.sanitize_info(info)
+    except Exception as e:
+        # yt-dlp exceptions carry tracebacks that don't always pickle
+        raise RuntimeError(str(e)) from None